@@ -7,19 +7,21 @@ import sys
 import logging
 import traceback
 import atexit
-import json
+import time
+import queue
 
-from pathlib import Path
 from logging import StreamHandler, NullHandler
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueListener
 
 from mxcubecore import HardwareRepository as HWR
 from mxcubecore import removeLoggingHandlers
 from mxcubecore.HardwareObjects import queue_entry
 from mxcubecore.utils.conversion import make_table
 
-from mxcube3.logging_handler import MX3LoggingHandler
+from mxcube3.logging_handler import MX3LoggingHandler, MX3QueueHandler
 from mxcube3.core.util.adapterutils import get_adapter_cls_from_hardware_object
+from mxcube3.core.util.sessionstore import SessionStore
+from mxcube3.core.util.snapshot import dump_snapshot, load_snapshot
 from mxcube3.core.adapter.adapter_base import AdapterBase
 from mxcube3.core.components.component_base import import_component
 from mxcube3.core.components.lims import Lims
@@ -46,6 +48,9 @@ class MXCUBECore:
     # Plotting
     plotting = None
 
+    # BeamlineAdapter
+    beamline = None
+
     adapter_dict = {}
 
     @staticmethod
@@ -201,10 +206,6 @@ class MXCUBEApplication:
     # Look up table for finding the limsID for a corresponding queueID (QueueNode)
     NODE_ID_TO_LIMS_ID = {}
 
-    # Initial file list for user, initialized at login, for creating automatic
-    # run numbers
-    INITIAL_FILE_LIST = []
-
     # Lookup table for sample changer location to data matrix or
     # data matrix to location
     SC_CONTENTS = {"FROM_CODE": {}, "FROM_LOCATION": {}}
@@ -220,6 +221,8 @@ class MXCUBEApplication:
 
     # Contains the complete client side ui state, managed up state_storage.py
     UI_STATE = dict()
+    # Incremented on every change of UI_STATE, see state_storage.py
+    UI_STATE_VERSION = 0
     TEMP_DISABLED = []
 
     # Below variables used for application wide settings
@@ -243,6 +246,18 @@ class MXCUBEApplication:
 
     CONFIG = None
 
+    # Persistent storage of the settings below, see save_settings
+    session_store = None
+
+    # True when the queue or sample list changed since the last snapshot,
+    # see invalidate_snapshot
+    snapshot_dirty = False
+
+    # Log record buffer (GET /log) and the handler queuing the log records
+    # for it, see init_logging
+    log_handler = None
+    log_queue_handler = None
+
     mxcubecore = MXCUBECore()
 
     server = None
@@ -264,6 +279,12 @@ class MXCUBEApplication:
         MXCUBEApplication.ALLOW_REMOTE = allow_remote
         MXCUBEApplication.TIMEOUT_GIVES_CONTROL = ra_timeout
         MXCUBEApplication.CONFIG = cfg
+        MXCUBEApplication.session_store = SessionStore(
+            cfg.app.SESSION_STORE_PATH,
+            MXCUBEApplication.get_settings,
+            delay=cfg.app.SESSION_SAVE_DELAY,
+            on_save=MXCUBEApplication.save_snapshot,
+        )
 
         MXCUBEApplication.mxcubecore.init(MXCUBEApplication)
 
@@ -293,7 +314,11 @@ class MXCUBEApplication:
         # Install server-side UI state storage
         MXCUBEApplication.init_state_storage()
 
-        # MXCUBEApplication.load_settings()
+        if cfg.app.SESSION_RESTORE:
+            try:
+                MXCUBEApplication.load_settings()
+            except Exception:
+                logging.getLogger("MX3.HWR").exception("Could not restore session")
 
     @staticmethod
     def init_sample_video(video_device):
@@ -345,6 +370,9 @@ class MXCUBEApplication:
     @staticmethod
     def init_logging(log_file):
         """
+        The loggers only put the records on a queue, the file, stdout and
+        client (socket.io) handlers are run by a listener thread.
+
         :param str log_file: Path to log file
 
         :return: None
@@ -365,7 +393,14 @@ class MXCUBEApplication:
         root_logger.setLevel(logging.INFO)
         root_logger.addHandler(NullHandler())
 
-        custom_log_handler = MX3LoggingHandler(MXCUBEApplication.server)
+        cfg = MXCUBEApplication.CONFIG.app
+        custom_log_handler = MX3LoggingHandler(
+            MXCUBEApplication.server,
+            capacity=cfg.LOG_BUFFER_SIZE,
+            emit_level=cfg.LOG_EMIT_LEVEL,
+            interval=cfg.LOG_EMIT_INTERVAL,
+            batch_size=cfg.LOG_EMIT_BATCH_SIZE,
+        )
         custom_log_handler.setLevel(logging.DEBUG)
         custom_log_handler.setFormatter(log_formatter)
 
@@ -377,6 +412,20 @@ class MXCUBEApplication:
         stdout_log_handler = StreamHandler(sys.stdout)
         stdout_log_handler.setFormatter(log_formatter)
 
+        handlers = [stdout_log_handler, custom_log_handler]
+
+        if log_file:
+            handlers.append(log_file_handler)
+
+        log_queue = queue.Queue(cfg.LOG_QUEUE_SIZE)
+        queue_log_handler = MX3QueueHandler(log_queue)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+        MXCUBEApplication.log_handler = custom_log_handler
+        MXCUBEApplication.log_queue_handler = queue_log_handler
+
         for logger in (
             exception_logger,
             hwr_logger,
@@ -384,11 +433,7 @@ class MXCUBEApplication:
             mx3_hwr_logger,
             queue_logger,
         ):
-            logger.addHandler(custom_log_handler)
-            logger.addHandler(stdout_log_handler)
-
-            if log_file:
-                logger.addHandler(log_file_handler)
+            logger.addHandler(queue_log_handler)
 
     @staticmethod
     def init_state_storage():
@@ -426,25 +471,19 @@ class MXCUBEApplication:
         return {key: value.dict() for (key, value) in MXCUBEApplication.CONFIG.app.ui_properties.items()}
 
     @staticmethod
-    def save_settings():
+    def get_settings():
         """
-        Saves all application wide variables to disk, stored-mxcube-session.json
+        Application wide variables to save, each UI state key is stored
+        separately (UI_STATE:<key>) so that a change of one of them does not
+        require the entire UI state to be written again. The queue and sample
+        list are saved in the binary snapshot, see save_snapshot.
         """
-        queue = MXCUBEApplication.queue.queue_to_dict(
-            HWR.beamline.queue_model.get_model_root()
-        )
-
         # For the moment not storing USERS
 
         data = {
-            "QUEUE": queue,
             "CURRENTLY_MOUNTED_SAMPLE": MXCUBEApplication.CURRENTLY_MOUNTED_SAMPLE,
             "SAMPLE_TO_BE_MOUNTED": MXCUBEApplication.SAMPLE_TO_BE_MOUNTED,
             "CENTRING_METHOD": MXCUBEApplication.CENTRING_METHOD,
-            "NODE_ID_TO_LIMS_ID": MXCUBEApplication.NODE_ID_TO_LIMS_ID,
-            "INITIAL_FILE_LIST": MXCUBEApplication.INITIAL_FILE_LIST,
-            "SC_CONTENTS": MXCUBEApplication.SC_CONTENTS,
-            "SAMPLE_LIST": MXCUBEApplication.SAMPLE_LIST,
             "TEMP_DISABLED": MXCUBEApplication.TEMP_DISABLED,
             "ALLOW_REMOTE": MXCUBEApplication.ALLOW_REMOTE,
             "TIMEOUT_GIVES_CONTROL": MXCUBEApplication.TIMEOUT_GIVES_CONTROL,
@@ -452,35 +491,110 @@ class MXCUBEApplication:
             "AUTO_MOUNT_SAMPLE": MXCUBEApplication.AUTO_MOUNT_SAMPLE,
             "AUTO_ADD_DIFFPLAN": MXCUBEApplication.AUTO_ADD_DIFFPLAN,
             "NUM_SNAPSHOTS": MXCUBEApplication.NUM_SNAPSHOTS,
-            "UI_STATE": MXCUBEApplication.UI_STATE,
         }
 
-        fname = Path("/tmp/stored-mxcube-session.json")
-        fname.touch(exist_ok=True)
+        for key, value in MXCUBEApplication.UI_STATE.items():
+            data["UI_STATE:" + key] = value
 
-        with open(fname, "w+") as fp:
-            json.dump(data, fp)
+        return data
 
     @staticmethod
-    def load_settings():
+    def save_settings(delayed=False):
         """
-        Loads application wide variables from "stored-mxcube-session.json"
+        Saves the application wide variables that changed since the last save
+        to the session store, stored-mxcube-session.json(.journal)
+
+        :param bool delayed: Save within SESSION_SAVE_DELAY seconds, merging
+                             the changes made in the meantime, instead of now
+        """
+        if delayed:
+            MXCUBEApplication.session_store.touch()
+        else:
+            MXCUBEApplication.session_store.save()
+
+    @staticmethod
+    def invalidate_snapshot():
+        """
+        Marks the snapshot as out of date, it is written again with the next
+        save of the session state
         """
-        with open("/tmp/stored-mxcube-session.json", "r") as f:
-            data = json.load(f)
+        MXCUBEApplication.snapshot_dirty = True
 
-        MXCUBEApplication.queue.load_queue_from_dict(data.get("QUEUE", {}))
+    @staticmethod
+    def save_snapshot():
+        """
+        Saves the queue, sample list, sample changer contents and LIMS id
+        mapping to the binary snapshot file (SNAPSHOT_PATH), if they changed
+        since the last snapshot
+        """
+        if not MXCUBEApplication.snapshot_dirty:
+            return
+
+        data = {
+            "QUEUE": MXCUBEApplication.queue.queue_to_dict(
+                HWR.beamline.queue_model.get_model_root()
+            ),
+            "SAMPLE_LIST": MXCUBEApplication.SAMPLE_LIST,
+            "SC_CONTENTS": MXCUBEApplication.SC_CONTENTS,
+            "NODE_ID_TO_LIMS_ID": MXCUBEApplication.NODE_ID_TO_LIMS_ID,
+        }
+
+        dump_snapshot(MXCUBEApplication.CONFIG.app.SNAPSHOT_PATH, data)
+        MXCUBEApplication.snapshot_dirty = False
+
+    @staticmethod
+    def load_snapshot():
+        """
+        Restores the queue, sample list, sample changer contents and LIMS id
+        mapping from the binary snapshot file (SNAPSHOT_PATH)
+
+        :returns: True if a snapshot was loaded, False if there is none
+        """
+        t0 = time.time()
+        data = load_snapshot(MXCUBEApplication.CONFIG.app.SNAPSHOT_PATH)
+
+        if data is None:
+            return False
 
-        MXCUBEApplication.CENTRING_METHOD = data.get(
-            "CENTRING_METHOD", queue_entry.CENTRING_METHOD.LOOP
-        )
-        MXCUBEApplication.NODE_ID_TO_LIMS_ID = data.get("NODE_ID_TO_LIMS_ID", {})
         MXCUBEApplication.SC_CONTENTS = data.get(
             "SC_CONTENTS", {"FROM_CODE": {}, "FROM_LOCATION": {}}
         )
         MXCUBEApplication.SAMPLE_LIST = data.get(
             "SAMPLE_LIST", {"sampleList": {}, "sampleOrder": []}
         )
+
+        id_map = MXCUBEApplication.queue.restore_queue(data.get("QUEUE", {}))
+
+        # The restored queue nodes have new node ids
+        MXCUBEApplication.NODE_ID_TO_LIMS_ID = {
+            id_map[node_id]: lims_id
+            for node_id, lims_id in data.get("NODE_ID_TO_LIMS_ID", {}).items()
+            if node_id in id_map
+        }
+
+        # The snapshot on disk holds the restored state
+        MXCUBEApplication.snapshot_dirty = False
+
+        logging.getLogger("MX3.HWR").info(
+            "Restored %s queue entries from snapshot in %.3f s"
+            % (len(id_map), time.time() - t0)
+        )
+
+        return True
+
+    @staticmethod
+    def load_settings():
+        """
+        Loads application wide variables from "stored-mxcube-session.json"
+        and the queue from the snapshot
+        """
+        data = MXCUBEApplication.session_store.load()
+
+        MXCUBEApplication.load_snapshot()
+
+        MXCUBEApplication.CENTRING_METHOD = data.get(
+            "CENTRING_METHOD", queue_entry.CENTRING_METHOD.LOOP
+        )
         MXCUBEApplication.ALLOW_REMOTE = data.get("ALLOW_REMOTE", False)
         MXCUBEApplication.TIMEOUT_GIVES_CONTROL = data.get(
             "TIMEOUT_GIVES_CONTROL", False
@@ -489,7 +603,14 @@ class MXCUBEApplication:
         MXCUBEApplication.AUTO_ADD_DIFFPLAN = data.get("AUTO_ADD_DIFFPLAN", False)
         MXCUBEApplication.NUM_SNAPSHOTS = data.get("NUM_SNAPSHOTS", False)
         MXCUBEApplication.UI_STATE = data.get("UI_STATE", {})
+        MXCUBEApplication.UI_STATE.update(
+            {
+                key.split(":", 1)[1]: value
+                for key, value in data.items()
+                if key.startswith("UI_STATE:")
+            }
+        )
 
     @staticmethod
     def app_atexit():
-        MXCUBEApplication.save_settings()
+        MXCUBEApplication.session_store.close()
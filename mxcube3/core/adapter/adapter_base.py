@@ -103,7 +103,22 @@ class AdapterBase:
         Signal handler to be used for sending the state to the client via
         socketIO
         """
-        self.app.server.emit("beamline_value_change", self.dict(), namespace="/hwr")
+        data = self.dict()
+        self._update_attribute_cache(data)
+        self.app.server.emit("beamline_value_change", data, namespace="/hwr")
+
+    def _update_attribute_cache(self, data, partial=False):
+        """
+        Updates the cached dictionary representation of the object, served
+        when all beamline attributes are requested.
+        Args:
+            data (dict): The (partial) dictionary representation
+            partial (bool): True if data only contains the changed fields
+        """
+        beamline = self.app.mxcubecore.beamline
+
+        if beamline is not None:
+            beamline.attribute_cache.update(self._name, data, partial)
 
     def _dict_repr(self):
         """
@@ -173,6 +188,7 @@ class ActuatorAdapterBase(AdapterBase):
         socketIO.
         """
         data = {"name": self._name, "value": args[0]}
+        self._update_attribute_cache(data, partial=True)
         self.app.server.emit("beamline_value_change", data, namespace="/hwr")
 
     # Abstract method
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import logging
+import time
 
 BEAMLINE_ADAPTER = None
 
@@ -18,6 +19,68 @@ def BeamlineAdapter(*args):
     return BEAMLINE_ADAPTER
 
 
+class AttributeCache:
+    """
+    Dictionary representations of the adapted hardware objects. Kept up to
+    date by the valueChanged and stateChanged handlers of the adapters, an
+    entry is read again from the hardware object when it is older than the
+    given max age. Each change increments the cache version, so that clients
+    can ask for the attributes changed since the version they have.
+    """
+
+    def __init__(self):
+        self.version = 0
+        # name -> [data, time read, version of last change]
+        self._entries = {}
+
+    def update(self, name, data, partial=False):
+        """
+        Args:
+            name (str): Adapter id
+            data (dict): Dictionary representation of the object
+            partial (bool): data only contains the changed fields, ignored
+                            if there is no entry for name yet
+        """
+        entry = self._entries.get(name)
+
+        if partial:
+            if entry is None:
+                return
+
+            data = dict(entry[0], **data)
+            read_time = entry[1]
+        else:
+            read_time = time.time()
+
+        if entry is None or entry[0] != data:
+            self.version += 1
+            self._entries[name] = [data, read_time, self.version]
+        else:
+            entry[1] = read_time
+
+    def get(self, name, read, max_age):
+        """
+        Args:
+            name (str): Adapter id
+            read (callable): Returns the dictionary representation from the
+                             hardware object
+            max_age (float): Max age in seconds of the cached data
+        Returns:
+            (tuple): data, version of last change
+        """
+        entry = self._entries.get(name)
+
+        if entry is None or time.time() - entry[1] > max_age:
+            self.update(name, read())
+            entry = self._entries[name]
+
+        return entry[0], entry[2]
+
+    def clear(self):
+        self._entries.clear()
+        self.version += 1
+
+
 class _BeamlineAdapter:
     """
     Adapter between Beamline route and Beamline hardware object.
@@ -27,6 +90,7 @@ class _BeamlineAdapter:
         self.app = app
         self._bl = beamline_hwobj
         self.adapter_dict = {}
+        self.attribute_cache = AttributeCache()
 
         workflow = self._bl.workflow
 
@@ -41,19 +105,27 @@ class _BeamlineAdapter:
     def get_object(self, name):
         return self.get_attr_from_path(name)
 
-    def dict(self):
+    def dict(self, since=None):
         """
-        Build dictionary value-representation for each beamline attribute
+        Build dictionary value-representation for each beamline attribute,
+        from the attribute cache.
+         Args:
+           since (int): Only include the attributes changed after this
+                        version of the attribute cache
          Returns:
            (dict): The dictionary.
         """
+        max_age = self.app.CONFIG.app.BEAMLINE_ATTRIBUTE_MAX_AGE
         attributes = {}
 
         for attr_name in self.app.mxcubecore.adapter_dict:
-            _d = self.app.mxcubecore.get_adapter(attr_name).dict()
-            attributes.update({attr_name: _d})
+            adapter = self.app.mxcubecore.get_adapter(attr_name)
+            _d, changed = self.attribute_cache.get(attr_name, adapter.dict, max_age)
+
+            if since is None or changed > since:
+                attributes.update({attr_name: _d})
 
-        return {"attributes": attributes}
+        return {"attributes": attributes, "version": self.attribute_cache.version}
 
     def get_available_methods(self):
         """
@@ -2,7 +2,7 @@ from mxcubecore.BaseHardwareObjects import HardwareObjectState
 
 from mxcube3.core.adapter.adapter_base import ActuatorAdapterBase
 from mxcube3.core.models.adaptermodels import HOModel, HOMachineInfoModel, HOActuatorValueChangeModel
-from mxcube3.core.util.networkutils import RateLimited
+from mxcube3.core.util.networkutils import RateLimited, instance_key
 
 
 class MachineInfoAdapter(ActuatorAdapterBase):
@@ -18,7 +18,7 @@ class MachineInfoAdapter(ActuatorAdapterBase):
     def _set_value(self, value):
         pass
 
-    @RateLimited(0.1)
+    @RateLimited(0.1, key=instance_key)
     def _value_change(self, *args, **kwargs):
         self.value_change(self.get_value(), **kwargs)
 
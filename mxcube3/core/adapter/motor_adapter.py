@@ -1,5 +1,5 @@
 from mxcube3.core.adapter.adapter_base import ActuatorAdapterBase
-from mxcube3.core.util.networkutils import RateLimited
+from mxcube3.core.util.networkutils import RateLimited, instance_key
 
 from mxcube3.core.models.adaptermodels import HOActuatorValueChangeModel, FloatValueModel
 
@@ -14,7 +14,7 @@ class MotorAdapter(ActuatorAdapterBase):
         ho.connect("valueChanged", self._value_change)
         ho.connect("stateChanged", self.state_change)
 
-    @RateLimited(6)
+    @RateLimited(6, key=instance_key)
     def _value_change(self, *args, **kwargs):
         self.value_change(*args, **kwargs)
 
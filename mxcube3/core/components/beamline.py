@@ -7,6 +7,7 @@ from mxcubecore import HardwareRepository as HWR
 from mxcube3.core.adapter.beamline_adapter import BeamlineAdapter
 from mxcube3.core.components.component_base import ComponentBase
 from mxcube3.core.components.queue import READY
+from mxcube3.video import streaming_processes
 
 
 class Beamline(ComponentBase):
@@ -134,6 +135,7 @@ class Beamline(ComponentBase):
                     "sourceIsScalable": source_is_scalable,
                     "scale": scale,
                     "videoSizes": video_sizes,
+                    "videoRenditions": renditions,
                     "position": position,
                     "shape": shape,
                     "size_x": sx, "size_y": sy}
@@ -147,11 +149,13 @@ class Beamline(ComponentBase):
             fmt, source_is_scalable = "MPEG1", True
             video_sizes = HWR.beamline.sample_view.camera.get_available_stream_sizes()
             (width, height, scale) = HWR.beamline.sample_view.camera.get_stream_size()
+            renditions = streaming_processes.get_renditions(width, height)
         else:
             scale = 1
             width = HWR.beamline.sample_view.camera.get_width()
             height = HWR.beamline.sample_view.camera.get_height()
             video_sizes = [(width, height)]
+            renditions = []
 
         pixelsPerMm = HWR.beamline.diffractometer.get_pixels_per_mm()
 
@@ -165,6 +169,7 @@ class Beamline(ComponentBase):
             "sourceIsScalable": source_is_scalable,
             "scale": scale,
             "videoSizes": video_sizes,
+            "videoRenditions": renditions,
             "videoHash": HWR.beamline.sample_view.camera.stream_hash,
         }
 
@@ -219,6 +224,16 @@ class Beamline(ComponentBase):
 
         return data
 
+    def beamline_get_attributes(self, since=None):
+        """
+        Dictionary representation of the beamline attributes, the attributes
+        changed after version <since> of the attribute cache if given.
+
+        :param int since: Attribute cache version
+        :returns: dict {"attributes": {...}, "version": version}
+        """
+        return BeamlineAdapter(HWR.beamline).dict(since)
+
     def beamline_abort_action(self, name):
         """
         Aborts an action in progress.
@@ -1,41 +1,142 @@
 import datetime
+import itertools
+import logging
+
+import gevent
+import gevent.lock
+import gevent.queue
 
 from flask_login import current_user
 
 from mxcube3.core.components.component_base import ComponentBase
+from mxcube3.core.components.user.database import background_session
 from mxcube3.core.util.networkutils import remote_addr
 
+# Seconds to wait for more messages before writing them to the database
+CHAT_FLUSH_INTERVAL = 1.0
+
+# Seconds to wait before writing messages again after a failed write, and
+# maximum number of messages kept for it (the oldest are dropped)
+CHAT_RETRY_INTERVAL = 10.0
+CHAT_RETRY_SIZE = 1000
+
 
 class Chat(ComponentBase):
     def __init__(self, app, config):
         super().__init__(app, config)
 
-    def db_add_message(self, user, message):
-        _m = self.app.server.user_datastore.create_message(message=message)
-        self.app.server.user_datastore.add_message_to_user(user, _m)
+        # Messages not yet written to the database,
+        # (message id, user id, message, date)
+        self._pending = gevent.queue.Queue()
+        # Messages of a failed write, written again with the next ones
+        self._retry = []
+        self._flush_lock = gevent.lock.RLock()
+        # Message ids are assigned when the message is sent, before it is
+        # written, so that clients can match it with the history
+        self._ids = None
+        gevent.spawn(self._write_behind)
+
+    def _write_behind(self):
+        while True:
+            if self._retry:
+                gevent.sleep(CHAT_RETRY_INTERVAL)
+            else:
+                # Wait for a message and let a burst of messages accumulate
+                self._pending.peek()
+                gevent.sleep(CHAT_FLUSH_INTERVAL)
+
+            self.flush()
+
+    def _next_id(self):
+        if self._ids is None:
+            last_id = self.app.server.user_datastore.last_message_id()
+            self._ids = itertools.count(last_id + 1)
+
+        return next(self._ids)
+
+    def _write(self, entries):
+        with background_session() as session:
+            self.app.server.user_datastore.add_messages(entries, session)
+
+    def flush(self):
+        """
+        Writes the pending messages to the database in one transaction, in a
+        thread of the gevent thread pool with a session of its own, so that
+        neither the event loop nor the sessions of the requests are held up.
+        If the write fails the messages are written again with the next
+        flush.
+        """
+        with self._flush_lock:
+            entries, self._retry = self._retry, []
+
+            while not self._pending.empty():
+                entries.append(self._pending.get_nowait())
+
+            if entries:
+                try:
+                    gevent.get_hub().threadpool.apply(self._write, (entries,))
+                except Exception:
+                    logging.getLogger("MX3.HWR").exception(
+                        "Could not save %s chat messages" % len(entries)
+                    )
+
+                    if len(entries) > CHAT_RETRY_SIZE:
+                        logging.getLogger("MX3.HWR").error(
+                            "Dropping %s chat messages"
+                            % (len(entries) - CHAT_RETRY_SIZE)
+                        )
+
+                    self._retry = entries[-CHAT_RETRY_SIZE:]
 
     def append_message(self, message, username):
         user = current_user.nickname
 
+        now = datetime.datetime.now()
+
         data = {
+            "id": self._next_id(),
             "message": message,
             "username": username,
             "nickname": user,
             "host": current_user.current_login_ip,
-            "date": datetime.datetime.now().strftime("%H:%M"),
+            "date": now.strftime("%H:%M"),
         }
 
-        self.db_add_message(current_user, message)
         self.app.server.emit("ra_chat_message", data, namespace="/hwr")
+        self._pending.put((data["id"], current_user.id, message, now))
 
     def get_all_messages(self):
-        message_list = []
+        return self.get_messages()["messages"]
 
-        for _m in self.app.server.user_datastore.get_all_messages():
-            user = _m.users.all()[0]
+    def get_messages(self, since=None, before=None, limit=None):
+        """
+        Page of the chat history, the last <limit> messages older than the
+        message with id <before> (and newer than the message with id
+        <since>), or if only <since> is given the first <limit> messages
+        newer than it, see UserDatastore.get_messages.
+
+        :returns: dict {"messages": [...], "more": bool}, more is True if
+                  there are more messages in the paging direction: newer
+                  ones when only <since> is given, older ones otherwise
+        """
+        # Make sure that the history includes the latest messages
+        self.flush()
+
+        # Fetch one more message to know if there are older ones
+        _limit = limit + 1 if limit else None
+        rows = self.app.server.user_datastore.get_messages(since, before, _limit)
+        more = bool(limit) and len(rows) > limit
+
+        if more:
+            # The extra message is the newest when paging forward from since
+            rows = rows[:-1] if since is not None and before is None else rows[1:]
+
+        message_list = []
 
+        for _m, user in rows:
             message_list.append(
                 {
+                    "id": _m.id,
                     "message": _m.message,
                     "username": user.username,
                     "nickname": user.nickname,
@@ -44,4 +145,4 @@ class Chat(ComponentBase):
                 }
             )
 
-        return message_list
+        return {"messages": message_list, "more": more}
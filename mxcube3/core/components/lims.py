@@ -8,11 +8,14 @@ import math
 import re
 import json
 
+import gevent
+from gevent.pool import Pool
+
 from mxcubecore import HardwareRepository as HWR
 from mxcubecore.HardwareObjects import queue_model_objects as qmo
 
 from mxcube3.core.components.component_base import ComponentBase
-from mxcube3.core.util import fsutils
+from mxcube3.core.util.cacheutils import TTLCache
 
 from flask import session
 from flask_login import current_user
@@ -20,10 +23,33 @@ from flask_login import current_user
 
 VALID_SAMPLE_NAME_REGEXP = re.compile("^[a-zA-Z0-9:+_-]+$")
 
+# Time in seconds collection results from LIMS are cached, and failed
+# lookups (i.e. collections not (yet) in LIMS)
+LIMS_RESULT_TTL = 60
+LIMS_RESULT_NEGATIVE_TTL = 10
+
+# Session of today lookups at login: number of concurrent lookups, time in
+# seconds each lookup may take and time the sessions are cached, short
+# enough for sessions created during the shift to show up
+LIMS_SESSION_POOL_SIZE = 8
+LIMS_SESSION_TIMEOUT = 10
+LIMS_SESSION_TTL = 15 * 60
+
 
 class Lims(ComponentBase):
     def __init__(self, app, config):
         super().__init__(app, config)
+        self._dc_cache = TTLCache(LIMS_RESULT_TTL, LIMS_RESULT_NEGATIVE_TTL)
+        self._session_cache = TTLCache(
+            LIMS_SESSION_TTL, LIMS_RESULT_NEGATIVE_TTL, uncached_errors=(TimeoutError,)
+        )
+
+        # Samples whose sample list entry or queue entry changed since the
+        # sample list was last synchronized with the queue, and the
+        # SAMPLE_LIST that was synchronized (all samples need to be
+        # synchronized when it is replaced)
+        self._dirty_samples = set()
+        self._synched_sample_list = None
 
     def new_sample_list(self):
         return {"sampleList": {}, "sampleOrder": []}
@@ -33,9 +59,13 @@ class Lims(ComponentBase):
 
     def sample_list_set(self, sample_list):
         self.app.SAMPLE_LIST = sample_list
+        self.app.invalidate_snapshot()
+        self.app.save_settings(delayed=True)
 
     def sample_list_set_order(self, sample_order):
         self.app.SAMPLE_LIST["sampleOrder"] = sample_order
+        self.app.invalidate_snapshot()
+        self.app.save_settings(delayed=True)
 
     def sample_list_get(self, loc=None, current_queue=None):
         self.synch_sample_list_with_queue(current_queue)
@@ -67,13 +97,37 @@ class Lims(ComponentBase):
             self.sample_list_update_sample(loc, lims_sample)
 
     def synch_sample_list_with_queue(self, current_queue=None):
+        """
+        Synchronizes the sample list with the queue, only the samples that
+        changed since the last synchronization (see sample_list_invalidate)
+        are synchronized and nothing is done if none changed.
+
+        The samples are marked as changed by Queue.invalidate_snapshot and
+        sample_list_update_sample, all changes to the queue model and to the
+        samples of the sample list have to go through those.
+
+        :param dict current_queue: The queue, as returned by queue_to_dict
+        """
+        sample_list = self.app.SAMPLE_LIST["sampleList"]
+        synched_sample_list = self.app.SAMPLE_LIST
+
+        if self._synched_sample_list is not synched_sample_list:
+            sample_ids = list(sample_list.keys())
+        else:
+            sample_ids = [loc for loc in self._dirty_samples if loc in sample_list]
+
+        if not sample_ids:
+            self._synched_sample_list = synched_sample_list
+            self._dirty_samples.clear()
+            return
+
         if not current_queue:
             current_queue = self.app.queue.queue_to_dict(include_lims_data=True)
 
-        current_queue.get("sample_order", [])
+        for loc in sample_ids:
+            data = sample_list.get(loc)
 
-        for loc, data in self.app.SAMPLE_LIST["sampleList"].items():
-            if loc in current_queue:
+            if data is not None and loc in current_queue:
                 sample = current_queue[loc]
 
                 # Don't synchronize, lims attributes from queue sample, if
@@ -99,10 +153,30 @@ class Lims(ComponentBase):
                 # in MXCuBE3
                 model.loc_str = data.get("sampleID", -1)
                 model.free_pin_mode = data.get("location", "") == "Manual"
+                self.app.queue.invalidate_snapshot(model)
 
                 self.sample_list_update_sample(loc, sample)
 
+        # Synchronizing marks the samples as changed again, they are now in
+        # sync though
+        self._synched_sample_list = synched_sample_list
+        self._dirty_samples.difference_update(sample_ids)
+
+    def sample_list_invalidate(self, loc=None):
+        """
+        Marks the sample <loc>, all samples if None, as changed so that it is
+        synchronized with the queue on the next read of the sample list, and
+        the queue and sample list snapshot as out of date
+        """
+        self.app.invalidate_snapshot()
+
+        if loc is None:
+            self._synched_sample_list = None
+        else:
+            self._dirty_samples.add(loc)
+
     def sample_list_update_sample(self, loc, sample):
+        self.sample_list_invalidate(loc)
         _sample = self.app.SAMPLE_LIST["sampleList"].get(loc, {})
 
         # If sample exists in sample list update it, otherwise add it
@@ -228,9 +302,7 @@ class Lims(ComponentBase):
                 )
                 return ERROR_CODE
 
-            for prop in session["proposal_list"]:
-                todays_session = HWR.beamline.lims.get_todays_session(prop)
-                prop["Session"] = [todays_session["session"]]
+            self.set_todays_sessions(loginID, session["proposal_list"])
 
             if hasattr(
                 HWR.beamline.session, "commissioning_fake_proposal"
@@ -262,15 +334,58 @@ class Lims(ComponentBase):
 
         return login_res
 
-    def create_lims_session(self, login_res):
-        for prop in session["proposal_list"]:
-            todays_session = HWR.beamline.lims.get_todays_session(prop)
-            prop["Session"] = [todays_session["session"]]
-
+    def create_lims_session(self, login_res, login_id=None):
+        self.set_todays_sessions(login_id, session["proposal_list"])
         login_res["proposalList"] = session["proposal_list"]
 
         return login_res
 
+    def set_todays_sessions(self, login_id, proposal_list):
+        """
+        Sets the session of today ("Session") of each proposal in
+        <proposal_list>. The sessions are looked up concurrently, at most
+        LIMS_SESSION_POOL_SIZE at the time and each limited to
+        LIMS_SESSION_TIMEOUT seconds, and cached per user for LIMS_SESSION_TTL
+        seconds so that logging in again does not look them up again. Lookups
+        that timed out are not cached, proposals without code and number and
+        lookups without login_id (that could be shared between users) are
+        always looked up.
+
+        :param str login_id: User the sessions are looked up for
+        :param list proposal_list: Proposals from LIMS
+        """
+
+        def _get_todays_session(prop):
+            with gevent.Timeout(LIMS_SESSION_TIMEOUT, TimeoutError):
+                return HWR.beamline.lims.get_todays_session(prop)["session"]
+
+        def _lookup(prop):
+            _p = prop.get("Proposal", {})
+
+            if not (login_id and _p.get("code") and _p.get("number")):
+                try:
+                    return _get_todays_session(prop)
+                except Exception:
+                    return None
+
+            return self._session_cache.get(
+                (login_id, _p["code"], _p["number"]),
+                lambda key: _get_todays_session(prop),
+            )
+
+        sessions = Pool(LIMS_SESSION_POOL_SIZE).map(_lookup, proposal_list)
+
+        for prop, todays_session in zip(proposal_list, sessions):
+            if todays_session is None:
+                _p = prop.get("Proposal", {})
+                logging.getLogger("MX3.HWR").error(
+                    "[LIMS] Could not get session of today for proposal %s%s"
+                    % (_p.get("code"), _p.get("number"))
+                )
+                todays_session = {}
+
+            prop["Session"] = [todays_session]
+
     def get_proposal_info(self, proposal):
         """
         Search for the given proposal in the proposal list.
@@ -332,6 +447,9 @@ class Lims(ComponentBase):
 
             session["proposal"] = proposal_info
 
+            # Default prefix and sub directory depends on the proposal
+            self.app.queue.invalidate_snapshot()
+
             if hasattr(HWR.beamline.session, "prepare_directories"):
                 try:
                     logging.getLogger("MX3.HWR").info(
@@ -343,12 +461,13 @@ class Lims(ComponentBase):
                         "[LIMS] Error creating data directories, %s" % sys.exc_info()[1]
                     )
 
-            # Get all the files in the root data dir for this user
+            # Index the run numbers of the files in the root data dir for
+            # this user, in the background
             root_path = HWR.beamline.session.get_base_image_directory()
 
-            if not self.app.INITIAL_FILE_LIST and os.path.isdir(root_path):
+            if os.path.isdir(root_path):
                 ftype = HWR.beamline.detector.get_property("file_suffix")
-                self.app.INITIAL_FILE_LIST = fsutils.scantree(root_path, [ftype])
+                self.app.queue.run_number_index.build(root_path, ftype)
 
             logging.getLogger("user_log").info("[LIMS] Proposal selected.")
 
@@ -356,14 +475,22 @@ class Lims(ComponentBase):
         else:
             return False
 
+    def _set_sample_model(self, sample, sample_data):
+        """
+        Sets the attributes of the Sample model <sample> used to derive the
+        default prefix from the sample dictionary <sample_data>
+        """
+        sample.code = sample_data.get("code", "")
+        sample.name = sample_data.get("sampleName", "").replace(":", "-")
+        sample.location = sample_data.get("location", "").split(":")
+        sample.lims_id = sample_data.get("limsID", -1)
+        sample.crystals[0].protein_acronym = sample_data.get("proteinAcronym", "")
+
+        return sample
+
     def get_default_prefix(self, sample_data, generic_name=False):
         if isinstance(sample_data, dict):
-            sample = qmo.Sample()
-            sample.code = sample_data.get("code", "")
-            sample.name = sample_data.get("sampleName", "").replace(":", "-")
-            sample.location = sample_data.get("location", "").split(":")
-            sample.lims_id = sample_data.get("limsID", -1)
-            sample.crystals[0].protein_acronym = sample_data.get("proteinAcronym", "")
+            sample = self._set_sample_model(qmo.Sample(), sample_data)
         else:
             sample = sample_data
 
@@ -386,6 +513,47 @@ class Lims(ComponentBase):
 
         return subdir.replace(":", "-")
 
+    def get_dc_result(self, lims_id, block=True):
+        """
+        Data of the collection with id <lims_id> from LIMS (lims_rest.get_dc),
+        cached for LIMS_RESULT_TTL seconds.
+
+        :param lims_id: LIMS collection id, "null" for collections not in LIMS
+        :param bool block: Wait for LIMS if the data is not cached, otherwise
+                           fetch it in the background and return {} (or the
+                           previously cached data)
+        :returns: dict with the collection data, {} if not available
+        """
+        if lims_id in (None, "", "null") or not HWR.beamline.lims.lims_rest:
+            return {}
+
+        return self._dc_cache.get(
+            lims_id, HWR.beamline.lims.lims_rest.get_dc, default={}, block=block
+        )
+
+    def dc_result_invalidate(self, lims_id):
+        """
+        Drops the cached data of the collection with id <lims_id>, to be
+        called when the collection changed (finished or failed)
+        """
+        self._dc_cache.invalidate(lims_id)
+
+    def get_dc(self, lims_id, block=True):
+        """
+        Collection data from LIMS, see get_dc_result, with the link to the
+        collection in LIMS (limsTaskLink)
+        """
+        limsres = self.get_dc_result(lims_id, block)
+
+        try:
+            limsres["limsTaskLink"] = self.get_dc_link(lims_id)
+        except Exception:
+            limsres["limsTaskLink"] = "#"
+            msg = "Could not get lims link for collection with id: %s" % lims_id
+            logging.getLogger("HWR").error(msg)
+
+        return limsres
+
     def get_dc_link(self, col_id):
         link = HWR.beamline.lims.lims_rest.dc_link(col_id)
 
@@ -413,18 +581,41 @@ class Lims(ComponentBase):
         return "qind", data
 
     def synch_with_lims(self):
+        """
+        Synchronizes the sample list with the samples of the current proposal
+        in LIMS. The LIMS samples are matched to the sample changer contents
+        (by code, or by location) and the sample list is updated in one go
+        once all samples are processed, so a LIMS sample with an invalid name
+        leaves the sample list untouched.
+
+        :returns: dict {"sampleList": {sampleID: sample}, "sampleOrder": [...],
+                  "added": [...], "updated": [...]}, sampleList only
+                  containing the samples that were added or updated
+        """
         proposal_id = HWR.beamline.session.proposal_id
 
         # session_id is not used, so we can pass None as second argument to
         # 'db_connection.get_samples'
         lims_samples = HWR.beamline.lims.get_samples(proposal_id, None)
 
-        samples_info_list = lims_samples
-
-        for sample_info in samples_info_list:
+        # Same for all samples
+        sample_link = HWR.beamline.lims.lims_rest.sample_link()
+        split_basket = HWR.beamline.sample_changer.__class__.__TYPE__ in [
+            "HCD",
+            "FlexHCD",
+            "RoboDiff",
+        ]
+        from_code = self.app.SC_CONTENTS["FROM_CODE"]
+        from_location = self.app.SC_CONTENTS["FROM_LOCATION"]
+        prefix_sample = qmo.Sample()
+        updates = {}
+
+        for sample_info in lims_samples:
             sample_info["limsID"] = sample_info.pop("sampleId")
-            sample_info["limsLink"] = HWR.beamline.lims.lims_rest.sample_link()
-            sample_info["defaultPrefix"] = self.get_default_prefix(sample_info)
+            sample_info["limsLink"] = sample_link
+            sample_info["defaultPrefix"] = HWR.beamline.session.get_default_prefix(
+                self._set_sample_model(prefix_sample, sample_info), False
+            )
             sample_info["defaultSubDir"] = self.get_default_subdir(sample_info)
 
             if not VALID_SAMPLE_NAME_REGEXP.match(sample_info["sampleName"]):
@@ -435,11 +626,7 @@ class Lims(ComponentBase):
             except (TypeError, ValueError, KeyError):
                 continue
             else:
-                if HWR.beamline.sample_changer.__class__.__TYPE__ in [
-                    "HCD",
-                    "FlexHCD",
-                    "RoboDiff",
-                ]:
+                if split_basket:
                     cell = int(math.ceil((basket) / 3.0))
                     puck = basket - 3 * (cell - 1)
                     sample_info["containerSampleChangerLocation"] = "%d:%d" % (
@@ -455,8 +642,44 @@ class Lims(ComponentBase):
                 logging.getLogger("MX3.HWR").info(
                     "[LIMS] Could not parse sample loaction from LIMS, (perhaps not set ?)"
                 )
+                continue
+
+            sample_info["lims_location"] = lims_location
+
+            # LIMS sample has code, check if the code was read by SC, otherwise
+            # asume that the samples have been put in the right place of the SC
+            lims_code = sample_info.get("code", None)
+            sc_sample = (lims_code and from_code.get(lims_code)) or from_location.get(
+                lims_location
+            )
+
+            if sc_sample:
+                updates.setdefault(sc_sample["sampleID"], {}).update(sample_info)
+
+        sample_list = self.app.SAMPLE_LIST["sampleList"]
+        added, updated = [], []
+
+        for loc, data in updates.items():
+            sample = sample_list.get(loc)
+
+            if not sample:
+                added.append(loc)
+            elif any(sample.get(key) != value for key, value in data.items()):
+                updated.append(loc)
             else:
-                sample_info["lims_location"] = lims_location
-                self.sample_list_sync_sample(sample_info)
+                continue
 
-        return self.sample_list_get()
+            self.sample_list_update_sample(loc, data)
+
+        changed = added + updated
+
+        if changed:
+            self.app.save_settings(delayed=True)
+            self.synch_sample_list_with_queue()
+
+        return {
+            "sampleList": {loc: sample_list[loc] for loc in changed},
+            "sampleOrder": self.app.SAMPLE_LIST["sampleOrder"],
+            "added": added,
+            "updated": updated,
+        }
@@ -6,7 +6,9 @@ import redis
 import itertools
 import logging
 import re
+import datetime
 
+from collections import deque
 from mock import Mock
 
 from flask_login import current_user
@@ -18,6 +20,7 @@ from mxcubecore.HardwareObjects import queue_model_enumerables as qme
 from mxcubecore.HardwareObjects.base_queue_entry import QUEUE_ENTRY_STATUS
 
 from mxcube3.core.components.component_base import ComponentBase
+from mxcube3.core.util import fsutils
 
 from functools import reduce
 
@@ -37,43 +40,63 @@ READY = 0
 
 ORIGIN_MX3 = "MX3"
 
+# Number of operations kept in the queue change log
+QUEUE_CHANGE_LOG_SIZE = 1000
+
 
 class Queue(ComponentBase):
     def __init__(self, app, config):
         super().__init__(app, config)
 
-    def build_prefix_path_dict(self, path_list):
-        prefix_path_dict = {}
-
-        for path in path_list:
-            try:
-                path, run_number, img_number = qmo.PathTemplate.interpret_path(path)
-            except ValueError:
-                logging.getLogger("MX3.HWR").info(
-                    '[QUEUE] Warning, failed to interpret path: "%s", please check path'
-                    % path
-                )
-                path, run_number, image_number = (path, 0, 0)
-
-            prefix_path_dict[path] = run_number
-
-        return prefix_path_dict
+        # Snapshot of the dictionary representation (as returned by
+        # _handle_sample) of each sample in the queue, keyed by sample node id.
+        # An entry is dropped when anything in the sample subtree changes and
+        # is rebuilt the next time the queue is read.
+        self._sample_dict_snapshot = {}
+
+        # Task index, the task node ids of each sample in the order used by
+        # the client (keyed by sample node id) and the reverse mapping task
+        # node id -> (sample node id, task index). Dropped together with the
+        # sample snapshot and rebuilt when needed.
+        self._sample_task_ids = {}
+        self._task_position = {}
+
+        # Compact record of the last operations applied to the queue
+        self._change_log = deque(maxlen=QUEUE_CHANGE_LOG_SIZE)
+
+        # Highest run number of the files on disk for each prefix path, saved
+        # next to the session state
+        self.run_number_index = fsutils.RunNumberIndex(
+            qmo.PathTemplate.interpret_path,
+            os.path.join(
+                os.path.dirname(app.CONFIG.app.SESSION_STORE_PATH),
+                "mxcube-run-numbers-%s.json",
+            ),
+        )
 
     def get_run_number(self, pt):
-        prefix_path_dict = self.build_prefix_path_dict(self.app.INITIAL_FILE_LIST)
-
         # Path templates of files not yet written to to disk, we are only
         # interested in the prefix path
         fname = pt.get_image_path()
         prefix_path, _, _ = qmo.PathTemplate.interpret_path(fname)
         run_number = HWR.beamline.queue_model.get_next_run_number(pt)
 
-        if prefix_path in prefix_path_dict:
-            rn = run_number + prefix_path_dict[prefix_path]
+        # The next run number after those of the tasks in the queue and of
+        # the files already on disk
+        return max(run_number, self.run_number_index.get(prefix_path) + 1)
+
+    def add_collected_files(self, model):
+        """
+        Adds the files of the finished collection <model> to the run number
+        index, see get_run_number
+        """
+        if isinstance(model, qmo.DataCollection):
+            pt = model.acquisitions[0].path_template
         else:
-            rn = run_number
+            pt = getattr(model, "path_template", None)
 
-        return rn
+        if pt is not None:
+            self.run_number_index.add_path(pt.get_image_path())
 
     def node_index(self, node):
         """
@@ -97,19 +120,7 @@ class Queue(ComponentBase):
             sample_model = node.get_sample_node()
 
             sample = sample_model.loc_str
-            task_groups = sample_model.get_children()
-            tlist = []
-
-            for group in task_groups:
-                if group.interleave_num_images:
-                    tlist.append(group)
-                else:
-                    tlist.extend(group.get_children())
-
-            try:
-                index = tlist.index(node)
-            except Exception:
-                pass
+            index = self._task_index(sample_model, node)
 
         return {
             "sample": sample,
@@ -118,6 +129,23 @@ class Queue(ComponentBase):
             "sample_node": sample_model,
         }
 
+    def _task_index(self, sample_model, node):
+        """
+        Index of <node> in the (flattened) task list of <sample_model>, the
+        task list of the sample is built once and then kept until the sample
+        changes, see invalidate_snapshot.
+
+        :returns: The index or None if node is not a task of sample_model
+        """
+        sid = sample_model._node_id
+        self._sample_task_list(sample_model)
+        position = self._task_position.get(node._node_id)
+
+        if position and position[0] == sid:
+            return position[1]
+
+        return None
+
     def load_queue_from_dict(self, queue_dict):
         """
         Loads the queue in queue_dict in to the current HWR.beamline.queue_model (HWR.beamline.queue_model)
@@ -126,12 +154,7 @@ class Queue(ComponentBase):
                                 queue_to_dict
         """
         if queue_dict:
-            item_list = []
-
-            for sid in queue_dict["sample_order"]:
-                item_list.append(queue_dict[sid])
-
-            self.queue_add_item(item_list)
+            self.restore_queue(queue_dict)
 
     def queue_to_dict(self, node=None, include_lims_data=False):
         """
@@ -158,8 +181,8 @@ class Queue(ComponentBase):
                 task dict can be directly used with the set_from_dict methods of
                 the corresponding node.
         """
-        if not node:
-            node = HWR.beamline.queue_model.get_model_root()
+        if not node or node is HWR.beamline.queue_model.get_model_root():
+            return self._queue_to_dict_from_snapshot(include_lims_data)
 
         res = reduce(
             lambda x, y: x.update(y) or x,
@@ -169,6 +192,137 @@ class Queue(ComponentBase):
 
         return res
 
+    def _sample_task_list(self, sample_model):
+        """
+        Node ids of the tasks of <sample_model> in the order they are listed
+        in the sample's "tasks" by queue_to_dict
+
+        :returns: List of node ids
+        """
+        sid = sample_model._node_id
+
+        if sid not in self._sample_task_ids:
+            tlist = []
+
+            for group in sample_model.get_children():
+                if group.interleave_num_images:
+                    tlist.append(group)
+                else:
+                    tlist.extend(group.get_children())
+
+            self._sample_task_ids[sid] = [_n._node_id for _n in tlist]
+
+            for idx, _n in enumerate(tlist):
+                self._task_position[_n._node_id] = (sid, idx)
+
+        return self._sample_task_ids[sid]
+
+    def _sample_nodes(self, node):
+        """
+        Sample nodes under <node>, in queue order
+        """
+        for child in node.get_children():
+            if isinstance(child, qmo.Sample):
+                yield child
+            else:
+                yield from self._sample_nodes(child)
+
+    def _queue_to_dict_from_snapshot(self, include_lims_data=False):
+        """
+        Same as queue_to_dict for the entire queue but using the sample
+        snapshot, only samples that changed since the last call are rebuilt.
+
+        The sample dictionaries returned are (shallow) copies so that callers
+        can pop or update keys without altering the snapshot.
+        """
+        res = {}
+        sample_order = []
+
+        for node in self._sample_nodes(HWR.beamline.queue_model.get_model_root()):
+            sample = self._sample_dict_snapshot.get(node._node_id)
+
+            if sample is None:
+                sample = self._handle_sample(node)[node.loc_str]
+                self._sample_dict_snapshot[node._node_id] = sample
+
+            if include_lims_data:
+                sample = self._add_lims_data(sample)
+            else:
+                sample = dict(sample)
+
+            res[node.loc_str] = sample
+
+            if node.is_enabled():
+                sample_order.append(node.loc_str)
+
+        if res:
+            res["sample_order"] = sample_order
+
+        return res
+
+    def _add_lims_data(self, sample):
+        """
+        Returns a copy of the sample dictionary <sample> where the result data
+        from LIMS have been added to each task, the same as passing
+        include_lims_data=True to queue_to_dict.
+        """
+        sample = dict(sample)
+
+        if not HWR.beamline.lims.lims_rest:
+            return sample
+
+        tasks = []
+
+        for task in sample["tasks"]:
+            if "limsResultData" in task:
+                task = dict(task)
+                lims_id = self.app.NODE_ID_TO_LIMS_ID.get(task["queueID"], "null")
+                task["limsResultData"] = self.app.lims.get_dc(lims_id)
+
+            tasks.append(task)
+
+        sample["tasks"] = tasks
+
+        return sample
+
+    def invalidate_snapshot(self, node=None):
+        """
+        Drops the snapshot and task index of the sample containing <node> so
+        that they are rebuilt when next needed, drops those of all samples if
+        <node> is None. The sample(s) are also marked to be synchronized with
+        the sample list, see Lims.sample_list_invalidate, and a save of the
+        session state (and thereby of the queue snapshot) is scheduled.
+
+        :param TaskNode node: Changed node (sample or task)
+        """
+        self.app.save_settings(delayed=True)
+
+        if node is None:
+            self._sample_dict_snapshot.clear()
+            self._sample_task_ids.clear()
+            self._task_position.clear()
+            self.app.lims.sample_list_invalidate()
+            return
+
+        try:
+            if isinstance(node, qmo.Sample):
+                sample_node = node
+            elif isinstance(node, qmo.RootNode):
+                sample_node = None
+            else:
+                sample_node = node.get_sample_node()
+        except Exception:
+            # Node not (or no longer) attached to a sample, be safe and
+            # rebuild everything
+            self.invalidate_snapshot()
+        else:
+            if sample_node is not None:
+                self._sample_dict_snapshot.pop(sample_node._node_id, None)
+                self.app.lims.sample_list_invalidate(sample_node.loc_str)
+
+                for _id in self._sample_task_ids.pop(sample_node._node_id, []):
+                    self._task_position.pop(_id, None)
+
     def queue_to_json(self, node=None, include_lims_data=False):
         """
         Returns the json representation of the queue
@@ -205,6 +359,61 @@ class Queue(ComponentBase):
 
         return json.dumps(res, sort_keys=True, indent=4)
 
+    def log_change(self, op, node=None, fields=None, index=None, **details):
+        """
+        Records a queue operation in the queue change log and writes a one
+        line summary of it to the log. The entire queue is only written to the
+        log if QUEUE_LOG_MODE is "full", it can otherwise be retrieved on
+        demand with queue_to_json.
+
+        :param str op: The operation i.e. "delete", "update", "swap" ...
+        :param TaskNode node: Node the operation was applied to
+        :param list fields: Names of the fields (parameters) that changed
+        :param dict index: Position of node as returned by node_index, for
+                           nodes no longer in the queue
+        :param details: Additional operation specific data
+        """
+        record = {
+            "op": op,
+            "queueID": None,
+            "sample": None,
+            "fields": fields or [],
+            "timestamp": datetime.datetime.now().isoformat(),
+        }
+
+        if node is not None:
+            node_index = index or self.node_index(node)
+            record["queueID"] = node_index["queue_id"]
+            record["sample"] = node_index["sample"]
+
+        record.update(details)
+        self._change_log.append(record)
+
+        msg = "[QUEUE] %s" % op
+
+        if record["queueID"] is not None:
+            msg += " node: %s (sample: %s)" % (record["queueID"], record["sample"])
+
+        if record["fields"]:
+            msg += " fields: %s" % ", ".join(map(str, record["fields"]))
+
+        if details:
+            msg += " %s" % details
+
+        logging.getLogger("MX3.HWR").info(msg)
+
+        if self.app.CONFIG.app.QUEUE_LOG_MODE == "full":
+            logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+
+        self.app.save_settings(delayed=True)
+
+    def get_change_log(self):
+        """
+        :returns: The recorded queue operations, oldest first
+        :rtype: list
+        """
+        return list(self._change_log)
+
     def get_node_state(self, node_id):
         """
         Get the state of the given node.
@@ -306,7 +515,7 @@ class Queue(ComponentBase):
         # Only add data from lims if explicitly asked for, since
         # its a operation that can take some time.
         if include_lims_data and HWR.beamline.lims.lims_rest:
-            limsres = HWR.beamline.lims.lims_rest.get_dc(lims_id)
+            limsres = self.app.lims.get_dc_result(lims_id)
 
         # Always add link to data, (no request made)
         limsres["limsTaskLink"] = self.app.lims.get_dc_link(lims_id)
@@ -358,7 +567,7 @@ class Queue(ComponentBase):
         # Only add data from lims if explicitly asked for, since
         # its a operation that can take some time.
         if include_lims_data and HWR.beamline.lims.lims_rest:
-            limsres = HWR.beamline.lims.lims_rest.get_dc(lims_id)
+            limsres = self.app.lims.get_dc_result(lims_id)
 
         # Always add link to data, (no request made)
         limsres["limsTaskLink"] = self.app.lims.get_dc_link(lims_id)
@@ -407,7 +616,7 @@ class Queue(ComponentBase):
         # Only add data from lims if explicitly asked for, since
         # its a operation that can take some time.
         if include_lims_data and HWR.beamline.lims.lims_rest:
-            limsres = HWR.beamline.lims.lims_rest.get_dc(lims_id)
+            limsres = self.app.lims.get_dc_result(lims_id)
 
         # Always add link to data, (no request made)
         limsres["limsTaskLink"] = self.app.lims.get_dc_link(lims_id)
@@ -518,7 +727,7 @@ class Queue(ComponentBase):
         # Only add data from lims if explicitly asked for, since
         # its a operation that can take some time.
         if include_lims_data and HWR.beamline.lims.lims_rest:
-            limsres = HWR.beamline.lims.lims_rest.get_dc(lims_id)
+            limsres = self.app.lims.get_dc_result(lims_id)
 
         # Always add link to data, (no request made)
         limsres["limsTaskLink"] = self.app.lims.get_dc_link(lims_id)
@@ -715,6 +924,7 @@ class Queue(ComponentBase):
         model, entry = self.get_entry(qid)
         model.set_enabled(enabled)
         entry.set_enabled(enabled)
+        self.invalidate_snapshot(model)
 
     def delete_entry(self, entry):
         """
@@ -723,8 +933,13 @@ class Queue(ComponentBase):
         parent_entry = entry.get_container()
         parent_entry.dequeue(entry)
         model = entry.get_data_model()
+
+        # The position of the node has to be taken before it is removed, the
+        # task list of the sample is then rebuilt without it
+        index = self.node_index(model)
         HWR.beamline.queue_model.del_child(model.get_parent(), model)
-        logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+        self.invalidate_snapshot(index["sample_node"] or model)
+        self.log_change("delete", model, index=index)
 
     def delete_entry_at(self, item_pos_list):
         current_queue = self.queue_to_dict()
@@ -757,13 +972,16 @@ class Queue(ComponentBase):
         :param bool flag: True for enabled False for disabled
         """
         if isinstance(id_or_qentry, qe.BaseQueueEntry):
+            model = id_or_qentry.get_data_model()
             id_or_qentry.set_enabled(flag)
-            id_or_qentry.get_data_model().set_enabled(flag)
+            model.set_enabled(flag)
         else:
             model, entry = self.get_entry(id_or_qentry)
             entry.set_enabled(flag)
             model.set_enabled(flag)
 
+        self.invalidate_snapshot(model)
+
     def swap_task_entry(self, sid, ti1, ti2):
         """
         Swaps order of two queue entries in the queue, with the same sample <sid>
@@ -776,8 +994,9 @@ class Queue(ComponentBase):
         current_queue = self.queue_to_dict()
 
         node_id = current_queue[sid]["queueID"]
-        smodel, sentry = self.get_entry(node_id)
+        self._swap_task_entry(*self.get_entry(node_id), ti1, ti2)
 
+    def _swap_task_entry(self, smodel, sentry, ti1, ti2):
         # Swap the order in the queue model
         ti2_temp_model = smodel.get_children()[ti2]
         smodel._children[ti2] = smodel._children[ti1]
@@ -788,7 +1007,8 @@ class Queue(ComponentBase):
         sentry._queue_entry_list[ti2] = sentry._queue_entry_list[ti1]
         sentry._queue_entry_list[ti1] = ti2_temp_entry
 
-        logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+        self.invalidate_snapshot(smodel)
+        self.log_change("swap", smodel, ti1=ti1, ti2=ti2)
 
     def move_task_entry(self, sid, ti1, ti2):
         """
@@ -802,15 +1022,17 @@ class Queue(ComponentBase):
         current_queue = self.queue_to_dict()
 
         node_id = current_queue[sid]["queueID"]
-        smodel, sentry = self.get_entry(node_id)
+        self._move_task_entry(*self.get_entry(node_id), ti1, ti2)
 
+    def _move_task_entry(self, smodel, sentry, ti1, ti2):
         # Swap the order in the queue model
         smodel._children.insert(ti2, smodel._children.pop(ti1))
 
         # Swap queue entry order
         sentry._queue_entry_list.insert(ti2, sentry._queue_entry_list.pop(ti1))
 
-        logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+        self.invalidate_snapshot(smodel)
+        self.log_change("move", smodel, ti1=ti1, ti2=ti2)
 
     def set_sample_order(self, order):
         """
@@ -819,9 +1041,12 @@ class Queue(ComponentBase):
         """
         current_queue = self.queue_to_dict()
         sid_list = list([sid for sid in order if current_queue.get(sid, False)])
+        queue_id_list = [current_queue[sid]["queueID"] for sid in sid_list]
+
+        self._set_sample_order(order, sid_list, queue_id_list)
 
+    def _set_sample_order(self, order, sid_list, queue_id_list):
         if sid_list:
-            queue_id_list = [current_queue[sid]["queueID"] for sid in sid_list]
             model_entry_list = [self.get_entry(qid) for qid in queue_id_list]
             model_list = [model_entry[0] for model_entry in model_entry_list]
             entry_list = [model_entry[1] for model_entry in model_entry_list]
@@ -832,8 +1057,254 @@ class Queue(ComponentBase):
             HWR.beamline.queue_manager._queue_entry_list = entry_list
 
         self.app.lims.sample_list_set_order(order)
+        self.log_change("sample_order", sampleOrder=sid_list)
+
+    def apply_batch(self, operations):
+        """
+        Applies a list of queue operations in one pass. Sample ids are
+        resolved once for the whole batch and the result of the batch is
+        returned as a single diff, rather than the queue being serialized after
+        each operation.
+
+        The operations have the same parameters as the corresponding single
+        operation routes:
+
+            {"op": "delete", "items": [[sid, tindex], ...]}
+            {"op": "set_enabled", "qidList": [qid, ...], "enabled": bool}
+            {"op": "swap", "sid": sid, "ti1": ti1, "ti2": ti2}
+            {"op": "move", "sid": sid, "ti1": ti1, "ti2": ti2}
+            {"op": "sample_order", "sampleOrder": [sid, ...]}
 
-        logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+        Operations are applied in order, task positions of an operation refer
+        to the queue as left by the preceding operations. The whole batch is
+        validated before anything is applied, an invalid batch leaves the
+        queue untouched.
+
+        :param list operations: List of operations
+        :returns: dictionary on the form:
+                {"sampleOrder": [sid, ...],
+                 "samples": {sid: sample, ...},  # changed samples
+                 "removed": [sid, ...]}          # removed samples
+        :raises ValueError: If the batch contains an invalid operation
+        """
+        root = HWR.beamline.queue_model.get_model_root()
+        samples = {node.loc_str: node for node in self._sample_nodes(root)}
+
+        self._validate_batch(operations, samples)
+
+        changed, removed = set(), set()
+
+        for operation in operations:
+            op = operation["op"]
+
+            if op == "delete":
+                # Resolve all positions before deleting anything
+                entries = []
+
+                for (sid, tindex) in operation["items"]:
+                    smodel = samples[sid]
+
+                    if tindex in ["undefined", None]:
+                        entry = self.get_entry(smodel._node_id)[1]
+                        removed.add(sid)
+                    else:
+                        node_id = self._sample_task_list(smodel)[int(tindex)]
+                        model, entry = self.get_entry(node_id)
+
+                        # Only one task per TaskGroup, remove the entire TaskGroup
+                        if not isinstance(entry, qe.TaskGroupQueueEntry):
+                            entry = entry.get_container()
+
+                        changed.add(sid)
+
+                    entries.append(entry)
+
+                for entry in entries:
+                    self.delete_entry(entry)
+
+                for sid in removed:
+                    samples.pop(sid, None)
+
+            elif op == "set_enabled":
+                for qid in operation["qidList"]:
+                    self.set_enabled_entry(qid, operation["enabled"])
+                    model = HWR.beamline.queue_model.get_node(int(qid))
+                    changed.add(self.node_index(model)["sample"])
+
+                self.log_change(
+                    "set_enabled",
+                    queueIDs=operation["qidList"],
+                    enabled=operation["enabled"],
+                )
+
+            elif op in ("swap", "move"):
+                sid = operation["sid"]
+                smodel = samples[sid]
+                sentry = self.get_entry(smodel._node_id)[1]
+                ti1, ti2 = int(operation["ti1"]), int(operation["ti2"])
+
+                if op == "swap":
+                    self._swap_task_entry(smodel, sentry, ti1, ti2)
+                else:
+                    self._move_task_entry(smodel, sentry, ti1, ti2)
+
+                changed.add(sid)
+
+            elif op == "sample_order":
+                order = operation["sampleOrder"]
+                sid_list = [sid for sid in order if sid in samples]
+                queue_id_list = [samples[sid]._node_id for sid in sid_list]
+                self._set_sample_order(order, sid_list, queue_id_list)
+
+        queue = self.queue_to_dict()
+
+        return {
+            "sampleOrder": queue.get("sample_order", []),
+            "samples": {sid: queue[sid] for sid in changed if sid in queue},
+            "removed": sorted(removed),
+        }
+
+    def _validate_batch(self, operations, samples):
+        """
+        Checks that each operation in <operations> is known, complete and
+        refers to samples, tasks and queue entries that exist when the
+        operation is applied. The operations are run against a simulated
+        queue (the task groups of each sample) so that positions are checked
+        against the queue as left by the preceding operations.
+
+        :raises ValueError: On the first invalid operation
+        """
+        required = {
+            "delete": ("items",),
+            "set_enabled": ("qidList", "enabled"),
+            "swap": ("sid", "ti1", "ti2"),
+            "move": ("sid", "ti1", "ti2"),
+            "sample_order": ("sampleOrder",),
+        }
+
+        if not isinstance(operations, list):
+            raise ValueError("Batch must be a list of operations")
+
+        # sid -> list of task groups (group node id, [task node id, ...]), the
+        # task ids being those listed by _sample_task_list
+        sim = {}
+
+        for sid, smodel in samples.items():
+            sim[sid] = []
+
+            for group in smodel.get_children():
+                if group.interleave_num_images:
+                    task_ids = [group._node_id]
+                else:
+                    task_ids = [_n._node_id for _n in group.get_children()]
+
+                sim[sid].append((group._node_id, task_ids))
+
+        deleted = set()
+
+        for idx, operation in enumerate(operations):
+            op = operation.get("op") if isinstance(operation, dict) else None
+
+            def error(msg, *args):
+                return ValueError("Operation %s (%s): %s" % (idx, op, msg % args))
+
+            if op not in required:
+                raise ValueError("Operation %s: unknown operation %s" % (idx, op))
+
+            missing = [key for key in required[op] if key not in operation]
+
+            if missing:
+                raise error("missing %s", ", ".join(missing))
+
+            if op == "delete":
+                if not isinstance(operation["items"], list):
+                    raise error("items must be a list of [sid, tindex]")
+
+                removed_sids, removed_groups = set(), set()
+
+                for item in operation["items"]:
+                    if not isinstance(item, (list, tuple)) or len(item) != 2:
+                        raise error("invalid item %s", item)
+
+                    sid, tindex = item
+                    groups = self._batch_sample(sim, sid, error)
+
+                    if tindex in ["undefined", None]:
+                        removed_sids.add(sid)
+                        continue
+
+                    flat = [
+                        (gidx, tid) for gidx, g in enumerate(groups) for tid in g[1]
+                    ]
+                    tindex = self._batch_index(tindex, len(flat), sid, error)
+                    group = (sid, flat[tindex][0])
+
+                    if group in removed_groups:
+                        raise error("task %s of sample %s deleted twice", tindex, sid)
+
+                    removed_groups.add(group)
+
+                for sid, gidx in sorted(removed_groups, reverse=True):
+                    group_id, task_ids = sim[sid].pop(gidx)
+                    deleted.add(group_id)
+                    deleted.update(task_ids)
+
+                for sid in removed_sids:
+                    deleted.add(samples[sid]._node_id)
+                    sim.pop(sid)
+
+            elif op == "set_enabled":
+                if not isinstance(operation["qidList"], list):
+                    raise error("qidList must be a list")
+
+                for qid in operation["qidList"]:
+                    try:
+                        node = HWR.beamline.queue_model.get_node(int(qid))
+                    except (TypeError, ValueError):
+                        node = None
+
+                    while node is not None and not isinstance(node, qmo.RootNode):
+                        if node._node_id in deleted:
+                            raise error("queue entry %s deleted", qid)
+
+                        node = node.get_parent()
+
+                    if node is None:
+                        raise error("no queue entry %s", qid)
+
+            elif op in ("swap", "move"):
+                sid = operation["sid"]
+                groups = self._batch_sample(sim, sid, error)
+                ti1 = self._batch_index(operation["ti1"], len(groups), sid, error)
+                ti2 = self._batch_index(operation["ti2"], len(groups), sid, error)
+
+                if op == "swap":
+                    groups[ti1], groups[ti2] = groups[ti2], groups[ti1]
+                else:
+                    groups.insert(ti2, groups.pop(ti1))
+
+            elif op == "sample_order":
+                if not isinstance(operation["sampleOrder"], list):
+                    raise error("sampleOrder must be a list")
+
+    @staticmethod
+    def _batch_sample(sim, sid, error):
+        if not isinstance(sid, str) or sid not in sim:
+            raise error("sample %s not in queue", sid)
+
+        return sim[sid]
+
+    @staticmethod
+    def _batch_index(index, length, sid, error):
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            raise error("invalid task index %s", index)
+
+        if not 0 <= index < length:
+            raise error("no task %s in sample %s", index, sid)
+
+        return index
 
     def queue_add_item(self, item_list):
         """
@@ -931,18 +1402,116 @@ class Queue(ComponentBase):
                 if not sample_node_id:
                     sample_node_id = item.get("sampleQueueID", None)
 
-            if item_t == "DataCollection":
-                self.add_data_collection(sample_node_id, item)
-            elif item_t == "Interleaved":
-                self.add_interleaved(sample_node_id, item)
-            elif item_t == "Characterisation":
-                self.add_characterisation(sample_node_id, item)
-            elif item_t == "Workflow" or item_t == "GphlWorkflow":
-                self.add_workflow(sample_node_id, item)
-            elif item_t == "XRFScan":
-                self.add_xrf_scan(sample_node_id, item)
-            elif item_t == "EnergyScan":
-                self.add_energy_scan(sample_node_id, item)
+                self._add_task(sample_node_id, item)
+
+    def _add_task(self, sample_node_id, item):
+        """
+        Adds the task described by <item> to the sample with node id
+        <sample_node_id>
+
+        :returns: The node id of the task, None for unknown task types
+        """
+        item_t = item["type"]
+        node_id = None
+
+        if item_t == "DataCollection":
+            node_id = self.add_data_collection(sample_node_id, item)
+        elif item_t == "Interleaved":
+            node_id = self.add_interleaved(sample_node_id, item)
+        elif item_t == "Characterisation":
+            node_id = self.add_characterisation(sample_node_id, item)
+        elif item_t == "Workflow" or item_t == "GphlWorkflow":
+            node_id = self.add_workflow(sample_node_id, item)
+        elif item_t == "XRFScan":
+            node_id = self.add_xrf_scan(sample_node_id, item)
+        elif item_t == "EnergyScan":
+            node_id = self.add_energy_scan(sample_node_id, item)
+
+        return node_id
+
+    def restore_queue(self, queue_dict):
+        """
+        Rebuilds a saved queue, queue_dict on the format returned by
+        queue_to_dict, in to the current (empty) queue model. Unlike
+        queue_add_item the items are taken as they were saved: the tasks keep
+        their run numbers, interleaved collections are not re-ordered and the
+        queue is not serialized again afterwards.
+
+        Shapes are not saved with the queue, see _strip_shapes. Samples and
+        tasks that can not be restored are skipped (and logged).
+
+        :param dict queue_dict: Saved queue
+        :returns: dict mapping the saved node ids to the new ones
+        """
+        id_map = {}
+        sample_order = queue_dict.get("sample_order", [])
+
+        for sid, sample in queue_dict.items():
+            if sid == "sample_order":
+                continue
+
+            sample = dict(sample)
+            tasks = sample.pop("tasks", [])
+            # Node ids are not kept, a saved sample is a new sample
+            saved_id = sample.pop("queueID", None)
+
+            try:
+                sample_node_id = self.add_sample(str(sample["sampleID"]), sample)
+
+                if sid not in sample_order:
+                    self.set_enabled_entry(sample_node_id, False)
+            except Exception:
+                logging.getLogger("MX3.HWR").exception(
+                    "[QUEUE] Could not restore sample %s" % sid
+                )
+                continue
+
+            id_map[saved_id] = sample_node_id
+
+            for task in tasks:
+                try:
+                    # The (saved) queueID of the task makes the add_ methods
+                    # keep the run number stored with it
+                    node_id = self._add_task(sample_node_id, self._strip_shapes(task))
+                except Exception as ex:
+                    logging.getLogger("MX3.HWR").warning(
+                        "[QUEUE] Could not restore %s %s of sample %s: %s"
+                        % (task.get("type"), task.get("queueID"), sid, ex)
+                    )
+                else:
+                    id_map[task.get("queueID")] = node_id
+
+        id_map.pop(None, None)
+
+        return id_map
+
+    def _strip_shapes(self, task):
+        """
+        Copy of the saved <task> without references to shapes (centred
+        points, lines and grids), which are not saved with the queue. Tasks on
+        a point lose their centred position and are centred again when
+        collected.
+
+        :raises ValueError: For helical and mesh collections, that can not be
+                            rebuilt without their line or grid
+        """
+        task = dict(task)
+
+        if "parameters" in task:
+            params = dict(task["parameters"])
+
+            if params.get("helical", False) or params.get("mesh", False):
+                raise ValueError("line or grid %s not saved" % params.get("shape"))
+
+            if "shape" in params:
+                params["shape"] = -1
+
+            if "wedges" in params:
+                params["wedges"] = [self._strip_shapes(w) for w in params["wedges"]]
+
+            task["parameters"] = params
+
+        return task
 
     def add_sample(self, sample_id, item):
         """
@@ -1601,6 +2170,7 @@ class Queue(ComponentBase):
         HWR.beamline.queue_model.clear_model("free-pin")
         HWR.beamline.queue_model.clear_model("plate")
         HWR.beamline.queue_model.select_model("ispyb")
+        self.invalidate_snapshot()
 
     def save_queue(self, session, redis=redis.Redis()):
         """
@@ -1640,6 +2210,8 @@ class Queue(ComponentBase):
         added. Handels for instance the addition of reference collections for
         characterisations and workflows.
         """
+        self.invalidate_snapshot(child)
+
         parent_model, parent_entry = self.get_entry(parent._node_id)
         child_model, child_entry = self.get_entry(child._node_id)
 
@@ -1674,6 +2246,7 @@ class Queue(ComponentBase):
                 parent_entry.enqueue(entry)
 
     def queue_model_diff_plan_available(self, char, collection_list):
+        self.invalidate_snapshot(char)
         cols = []
         for collection in collection_list:
             if isinstance(collection, qmo.DataCollection):
@@ -1958,6 +2531,7 @@ class Queue(ComponentBase):
                 qe.get_data_model().set_executed(True)
                 qe.get_data_model().set_enabled(False)
                 qe._execution_failed = True
+                self.invalidate_snapshot(qe.get_data_model())
 
                 HWR.beamline.queue_manager._is_stopped = True
                 signals.queue_execution_stopped()
@@ -2015,13 +2589,23 @@ class Queue(ComponentBase):
     def queue_update_item(self, sqid, tqid, data):
         model, entry = self.get_entry(tqid)
         sample_model, sample_entry = self.get_entry(sqid)
+        before = self.queue_to_dict([model]).get("parameters", {})
 
         if data["type"] == "DataCollection":
             self.set_dc_params(model, entry, data, sample_model)
         elif data["type"] == "Characterisation":
             self.set_char_params(model, entry, data, sample_model)
 
-        logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+        self.invalidate_snapshot(model)
+
+        after = self.queue_to_dict([model]).get("parameters", {})
+        fields = sorted(
+            key
+            for key in set(before) | set(after)
+            if before.get(key) != after.get(key)
+        )
+
+        self.log_change("update", model, fields)
 
         return model
 
@@ -2030,7 +2614,7 @@ class Queue(ComponentBase):
         for qid in qid_list:
             self.set_enabled_entry(qid, enabled)
 
-        logging.getLogger("MX3.HWR").info("[QUEUE] is:\n%s " % self.queue_to_json())
+        self.log_change("set_enabled", queueIDs=qid_list, enabled=enabled)
 
     def update_sample(self, sid, params):
 
@@ -2041,6 +2625,7 @@ class Queue(ComponentBase):
             # TODO: update here the model with the new 'params'
             # missing lines...
             sample_entry.set_data_model(sample_node)
+            self.invalidate_snapshot(sample_node)
             logging.getLogger("MX3.HWR").info("[QUEUE] sample updated")
         else:
             msg = "[QUEUE] Sample with id %s not in queue, can't update" % sid
@@ -2051,6 +2636,7 @@ class Queue(ComponentBase):
         node = HWR.beamline.queue_model.get_node(node_id)
         entry = HWR.beamline.queue_manager.get_entry_with_model(node)
         queue = self.queue_to_dict()
+        self.invalidate_snapshot(node)
 
         if isinstance(entry, qe.SampleQueueEntry):
             # this is a sample entry, thus, go through its checked children and
@@ -2131,6 +2717,7 @@ class Queue(ComponentBase):
 
         new_node = HWR.beamline.queue_model.add_child_at_id(int(_id), cent_node)
         entry.enqueue(cent_entry)
+        self.invalidate_snapshot(node)
 
         logging.getLogger("MX3.HWR").info("[QUEUE] centring added to sample")
 
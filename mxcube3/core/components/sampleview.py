@@ -8,7 +8,7 @@ import inspect
 import PIL
 import gevent.event
 
-from io import StringIO
+from io import BytesIO
 import base64
 
 from mxcube3.core.util.convertutils import to_camel, from_camel
@@ -26,11 +26,61 @@ from mxcube3.core.components.component_base import ComponentBase
 SNAPSHOT_RECEIVED = gevent.event.Event()
 SNAPSHOT = None
 
+# Number of frames kept for the MJPEG subscribers
+FRAME_BUFFER_SIZE = 8
+
+
+class FrameRingBuffer:
+    """
+    Bounded buffer of the last encoded video frames. Each subscriber reads
+    with its own cursor (sequence number of the next frame to read), a
+    subscriber that falls more than the size of the buffer behind skips
+    ahead to the latest frame, so that a slow client only drops frames and
+    never holds back the others.
+    """
+
+    def __init__(self, size=FRAME_BUFFER_SIZE):
+        self._size = size
+        self._frames = [None] * size
+        # Sequence number of the next frame
+        self._seq = 0
+        self._new_frame = gevent.event.Event()
+        self.dropped = 0
+
+    def push(self, frame):
+        self._frames[self._seq % self._size] = frame
+        self._seq += 1
+
+        self._new_frame.set()
+        self._new_frame.clear()
+
+    def subscribe(self):
+        """
+        :returns: Cursor of a new subscriber, starting at the latest frame
+        """
+        return max(self._seq - 1, 0)
+
+    def read(self, cursor):
+        """
+        Waits for the frame at <cursor> (or later) to be available
+
+        :returns: Tuple frame, cursor of the next frame
+        """
+        while cursor >= self._seq:
+            self._new_frame.wait()
+
+        if self._seq - cursor > self._size:
+            self.dropped += self._seq - 1 - cursor
+            cursor = self._seq - 1
+
+        return self._frames[cursor % self._size], cursor + 1
+
 
 class SampleView(ComponentBase):
     def __init__(self, app, config):
         super().__init__(app, config)
-        self._sample_image = None
+        self._frame_buffer = FrameRingBuffer()
+        self._video_connected = False
         self._click_count = 0
         self._click_limit = 3
         self._centring_point_id = None
@@ -147,8 +197,8 @@ class SampleView(ComponentBase):
 
     def new_sample_video_frame_received(self, img, width, height, *args, **kwargs):
         """
-        Executed when a new image is received, update the centred positions
-        and set the gevent so the new image can be sent.
+        Executed when a new image is received, the image is encoded and
+        framed once and pushed to the frame buffer read by the subscribers.
         """
         # Assume that we are gettign a qimage if we are not getting a str,
         # to be able to handle data sent by hardware objects used in MxCuBE 2.x
@@ -159,46 +209,57 @@ class SampleView(ComponentBase):
             img = img
         else:
             rawdata = img.bits().asstring(img.numBytes())
-            strbuf = StringIO()
+            strbuf = BytesIO()
             image = PIL.Image.frombytes("RGBA", (width, height), rawdata)
             (r, g, b, a) = image.split()
             image = PIL.Image.merge("RGB", (b, g, r))
             image.save(strbuf, "JPEG")
-            img = strbuf.get_value()
-
-        self._sample_image = img
+            img = strbuf.getvalue()
 
-        HWR.beamline.sample_view.camera.new_frame.set()
-        HWR.beamline.sample_view.camera.new_frame.clear()
+        self._frame_buffer.push(
+            b"--frame\r\n" b"--!>\nContent-type: image/jpeg\n\n" + img + b"\r\n"
+        )
 
     def stream_video(self, camera):
         """it just send a message to the client so it knows that there is a new
         image. A HO is supplying that image
         """
-        HWR.beamline.sample_view.camera.new_frame = gevent.event.Event()
-
-        try:
-            HWR.beamline.sample_view.camera.disconnect(
+        # All subscribers share the same frames, connect only once
+        if not self._video_connected:
+            HWR.beamline.sample_view.camera.connect(
                 "imageReceived", self.new_sample_video_frame_received
             )
-        except KeyError:
-            pass
+            self._video_connected = True
 
-        HWR.beamline.sample_view.camera.connect(
-            "imageReceived", self.new_sample_video_frame_received
-        )
+        cursor = self._frame_buffer.subscribe()
 
         while True:
             try:
-                camera.new_frame.wait()
-                yield (
-                    b"--frame\r\n"
-                    b"--!>\nContent-type: image/jpeg\n\n" + self._sample_image + b"\r\n"
-                )
+                frame, cursor = self._frame_buffer.read(cursor)
+                yield frame
             except Exception:
                 pass
 
-    def set_image_size(self, width, height):
+    def set_image_size(self, width, height, rendition=None):
+        """
+        Sets the size of the video stream to <width> x <height>, the stream is
+        restarted (for all clients). A client can instead select one of the
+        renditions of the stream by name, <rendition>, the stream is then left
+        as is and the client connects to the websocket port of the rendition.
+
+        :returns: The view port info, with the selected rendition if any
+        :rtype: dict
+        """
+        if rendition is not None:
+            data = self.app.beamline.get_viewport_info()
+
+            for _r in data.get("videoRenditions", []):
+                if _r["name"] == rendition:
+                    data["videoRendition"] = _r["name"]
+                    break
+
+            return data
+
         HWR.beamline.sample_view.camera.restart_streaming((width, height))
         return self.app.beamline.get_viewport_info()
 
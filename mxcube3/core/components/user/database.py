@@ -1,7 +1,8 @@
+import contextlib
 import datetime
 import typing
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, inspect, or_, text
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from flask_security import SQLAlchemySessionUserDatastore
@@ -13,10 +14,64 @@ db_session = scoped_session(
 Base = declarative_base()
 Base.query = db_session.query_property()
 
+# Sessions of the background jobs (chat write behind, purge). The scoped
+# session above is shared by all greenlets (the threads are not patched) and
+# must only be used by the request handlers.
+BackgroundSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Max number of ids in one IN clause, SQLite limits the number of variables
+# of a statement
+IN_CHUNK_SIZE = 500
+
+
+def _chunks(seq, size=IN_CHUNK_SIZE):
+    for i in range(0, len(seq), size):
+        yield seq[i : i + size]
+
+
+def compact_db():
+    """
+    Rebuilds the database file to reclaim the space of deleted rows and
+    updates the statistics used by the query planner.
+    """
+    # VACUUM can not be run inside a transaction
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("VACUUM"))
+        conn.execute(text("ANALYZE"))
+
+
+@contextlib.contextmanager
+def background_session():
+    """
+    Session of its own for a background job, rolled back if the job fails
+    and closed when done.
+    """
+    session = BackgroundSession()
+
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
+    # create_all does not add new indexes to already existing tables
+    inspector = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+
 
 class UserDatastore(SQLAlchemySessionUserDatastore):
     """A UserDatastore implementation that assumes the
@@ -43,9 +98,139 @@ class UserDatastore(SQLAlchemySessionUserDatastore):
         self.put(user)
         self.commit()
 
+    def last_message_id(self):
+        """
+        Id of the latest message, 0 if there are none
+        """
+        return self.db.session.query(func.max(self._message_model.id)).scalar() or 0
+
+    def add_messages(self, entries, session=None):
+        """
+        Inserts several messages in one transaction
+
+        :param list entries: List of (message id, user id, message, datetime)
+                             tuples
+        :param Session session: Session to use, the datastore session if None
+        """
+        session = session or self.db.session
+        messages_users = self.user_model.messages.property.secondary
+
+        messages = [
+            self._message_model(id=_id, message=message, at=at)
+            for (_id, _, message, at) in entries
+        ]
+
+        session.add_all(messages)
+        session.flush()
+
+        session.execute(
+            messages_users.insert(),
+            [
+                {"user_id": user_id, "message_id": _id}
+                for (_id, user_id, _, _) in entries
+            ],
+        )
+
+        session.commit()
+
+    def purge(self, max_age, session=None):
+        """
+        Deletes the messages older than <max_age> and the session users that
+        are inactive, not in control, have not logged in for <max_age> and
+        have no remaining messages.
+
+        :param datetime.timedelta max_age: Age of the oldest records to keep
+        :param Session session: Session to use, the datastore session if None
+        :returns: Tuple, number of deleted users and messages
+        """
+        # Messages are timestamped in local time, logins in UTC
+        horizon = datetime.datetime.now() - max_age
+        login_horizon = datetime.datetime.utcnow() - max_age
+
+        session = session or self.db.session
+        user_model, message_model = self.user_model, self._message_model
+        messages_users = user_model.messages.property.secondary
+        roles_users = user_model.roles.property.secondary
+
+        message_ids = [
+            _id
+            for (_id,) in session.query(message_model.id).filter(
+                message_model.at < horizon
+            )
+        ]
+
+        for ids in _chunks(message_ids):
+            session.execute(
+                messages_users.delete().where(messages_users.c.message_id.in_(ids))
+            )
+            session.query(message_model).filter(message_model.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+
+        user_ids = [
+            _id
+            for (_id,) in session.query(user_model.id).filter(
+                or_(user_model.active == False, user_model.active == None),
+                or_(user_model.in_control == False, user_model.in_control == None),
+                user_model.current_login_at < login_horizon,
+                ~user_model.messages.any(),
+            )
+        ]
+
+        for ids in _chunks(user_ids):
+            session.execute(roles_users.delete().where(roles_users.c.user_id.in_(ids)))
+            session.query(user_model).filter(user_model.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+
+        session.commit()
+
+        return len(user_ids), len(message_ids)
+
     def get_all_messages(self):
         return self._message_model.query.all()
 
+    def get_messages(self, since=None, before=None, limit=None):
+        """
+        Messages with their author, fetched with one query. The messages are
+        paged with their id (which increases with time): the last <limit>
+        messages with an id smaller than <before> (and greater than <since>),
+        or if only <since> is given the first <limit> messages with an id
+        greater than <since>, so that a client can catch up from its last
+        message.
+
+        :returns: List of (message, user) tuples, oldest first
+        """
+        session = self.db.session
+        user_model, message_model = self.user_model, self._message_model
+        messages_users = user_model.messages.property.secondary
+
+        query = (
+            session.query(message_model, user_model)
+            .join(messages_users, messages_users.c.message_id == message_model.id)
+            .join(user_model, user_model.id == messages_users.c.user_id)
+        )
+
+        if since is not None:
+            query = query.filter(message_model.id > since)
+
+        if before is not None:
+            query = query.filter(message_model.id < before)
+
+        forward = since is not None and before is None
+
+        if forward:
+            query = query.order_by(message_model.id.asc())
+        else:
+            query = query.order_by(message_model.id.desc())
+
+        if limit is not None:
+            query = query.limit(limit)
+
+        rows = query.all()
+
+        return rows if forward else list(reversed(rows))
+
     def append_roles(self, user, roles):
         for role in roles:
             if not user.has_role(role):
@@ -8,8 +8,16 @@ import flask
 import flask_security
 import flask_login
 import flask_socketio
+import gevent
+
+from sqlalchemy import or_
 
 from mxcube3.core.components.component_base import ComponentBase
+from mxcube3.core.components.user.database import (
+    background_session,
+    compact_db,
+    db_session,
+)
 from mxcube3.core.models.usermodels import User
 from mxcube3.core.util.networkutils import is_local_host, remote_addr
 from mxcube3.core.util.convertutils import convert_to_dict
@@ -21,22 +29,79 @@ class BaseUserManager(ComponentBase):
     def __init__(self, app, config):
         super().__init__(app, config)
 
-    def get_observers(self):
-        return [
-            user
-            for user in User.query.all()
-            if ((not user.in_control) and user.is_authenticated and user.is_active)
-        ]
+        # The operator and the observers (User rows), looked up when needed
+        # after a change of control or of the users, see invalidate_user_cache
+        self._operator = None
+        self._observers = []
+        self._user_cache_valid = False
 
-    def get_operator(self):
-        user = None
+        if self.config.retention_days > 0:
+            gevent.spawn(self._retention_job)
 
-        for _u in User.query.all():
-            if _u.in_control:
-                user = _u
-                break
+    def _retention_job(self):
+        """
+        Periodically deletes old session users and chat messages from the
+        user database and compacts it, see UserDatastore.purge
+        """
+        while True:
+            gevent.sleep(self.config.retention_interval * 3600)
+            self.purge_user_db()
 
-        return user
+    def _purge(self, max_age):
+        with background_session() as session:
+            result = self.app.server.user_datastore.purge(max_age, session)
+
+        compact_db()
+
+        return result
+
+    def purge_user_db(self):
+        """
+        Runs the purge in a thread of the gevent thread pool, with a session
+        of its own, so that the requests are neither blocked nor share their
+        session with it.
+        """
+        max_age = datetime.timedelta(days=self.config.retention_days)
+
+        try:
+            users, messages = gevent.get_hub().threadpool.apply(
+                self._purge, (max_age,)
+            )
+        except Exception:
+            logging.getLogger("MX3.HWR").exception("Could not purge user database")
+        else:
+            self.invalidate_user_cache()
+            msg = "[USERS] Purged %s users and %s messages older than %s days"
+            logging.getLogger("MX3.HWR").info(
+                msg % (users, messages, self.config.retention_days)
+            )
+
+    def invalidate_user_cache(self):
+        self._user_cache_valid = False
+
+    def _update_user_cache(self):
+        users = self._observers + ([self._operator] if self._operator else [])
+
+        # The rows are only valid as long as they belong to the session
+        if not self._user_cache_valid or not all(
+            user in db_session for user in users
+        ):
+            self._operator = User.query.filter(User.in_control == True).first()
+
+            self._observers = User.query.filter(
+                or_(User.in_control == False, User.in_control == None),
+                User.active == True,
+            ).all()
+
+            self._user_cache_valid = True
+
+    def get_observers(self):
+        self._update_user_cache()
+        return list(self._observers)
+
+    def get_operator(self):
+        self._update_user_cache()
+        return self._operator
 
     def is_operator(self):
         return getattr(flask_login.current_user, "in_control", False)
@@ -56,23 +121,18 @@ class BaseUserManager(ComponentBase):
         return users
 
     def get_user(self, username):
-        user = None
-
-        for _u in User.query.all():
-            if _u.username == username:
-                user = _u
-
-        return user
+        return User.query.filter(User.username == username).first()
 
     def set_operator(self, username):
-        user = None
+        user = self.get_user(username)
 
-        for _u in User.query.all():
-            if _u.username == username:
-                self.db_set_in_control(_u, True)
-                user = _u
-            else:
-                self.db_set_in_control(_u, False)
+        if user:
+            self.db_set_in_control(user, True)
+        else:
+            operator = self.get_operator()
+
+            if operator:
+                self.db_set_in_control(operator, False)
 
         return user
 
@@ -88,13 +148,11 @@ class BaseUserManager(ComponentBase):
         self.app.server.emit("observersChanged", data, namespace="/hwr")
 
     def update_operator(self, new_login=False):
-        active_in_control = False
-
-        for _u in User.query.all():
-            if _u.is_authenticated and _u.in_control:
-                active_in_control = True
-            else:
-                self.db_set_in_control(_u, False)
+        """
+        Gives control to the current user if nobody is in control, emits
+        observersChanged (once) if control was given or on a new login
+        """
+        active_in_control = self.get_operator() is not None
 
         # If new login and new observer login, clear nickname
         # so that the user get an opertunity to set one
@@ -112,12 +170,13 @@ class BaseUserManager(ComponentBase):
             self.db_set_in_control(flask_login.current_user, True)
 
         # Set active proposal to that of the active user
-        for _u in User.query.all():
-            if _u.is_authenticated and _u.in_control:
-                if HWR.beamline.lims.loginType.lower() != "user":
-                    self.app.lims.select_proposal(
-                        self.app.lims.get_proposal(_u)
-                    )
+        operator = self.get_operator()
+
+        if operator and HWR.beamline.lims.loginType.lower() != "user":
+            self.app.lims.select_proposal(self.app.lims.get_proposal(operator))
+
+        if new_login or not active_in_control:
+            self.emit_observers_changed()
 
     def handle_disconnect(self, username):
         time.sleep(30)
@@ -162,6 +221,7 @@ class BaseUserManager(ComponentBase):
 
             # Important to make flask_security user tracking work
             self.app.server.security.datastore.commit()
+            self.invalidate_user_cache()
 
             address, barcode = self.app.sample_changer.get_loaded_sample()
 
@@ -174,12 +234,12 @@ class BaseUserManager(ComponentBase):
             # uncomment to enable loading.
             # self.app.queue.load_queue(session)
             # logging.getLogger('MX3.HWR').info('Loaded queue')
+            queue = self.app.queue.queue_to_dict()
             logging.getLogger("MX3.HWR").info(
-                "[QUEUE] %s " % self.app.queue.queue_to_json()
+                "[QUEUE] %s samples in queue" % len(queue.get("sample_order", []))
             )
 
             self.update_operator(new_login=True)
-            self.emit_observers_changed()
 
             msg = "User %s signed in" % user
             logging.getLogger("MX3.HWR").info(msg)
@@ -214,6 +274,8 @@ class BaseUserManager(ComponentBase):
             logging.getLogger("MX3.HWR").info(msg)
 
         self.app.server.user_datastore.deactivate_user(user)
+        self.app.server.user_datastore.commit()
+        self.invalidate_user_cache()
         flask_security.logout_user()
         self.emit_observers_changed()
 
@@ -274,6 +336,7 @@ class BaseUserManager(ComponentBase):
     def update_user(self, user):
         self.app.server.user_datastore.put(user)
         self.app.server.user_datastore.commit()
+        self.invalidate_user_cache()
 
     def _get_configured_roles(self, user):
         roles = set()
@@ -323,22 +386,21 @@ class BaseUserManager(ComponentBase):
         return user_datastore.find_user(username=username)
 
     def db_set_in_control(self, user, control):
-        user_datastore = self.app.server.user_datastore
-
+        """
+        Gives control to <user>, taking it from any other user, or takes
+        control from <user>. Done with one UPDATE statement in one
+        transaction, callers are responsible for emitting observersChanged.
+        """
         if control:
-            for _u in User.query.all():
-                if _u.username == user.username:
-                    _u.in_control = True
-                else:
-                    _u.in_control = False
-
-                user_datastore.put(_u)
+            query = User.query.filter(or_(User.in_control == True, User.id == user.id))
+            values = {User.in_control: User.id == user.id}
         else:
-            _u = user_datastore.find_user(username=user.username)
-            _u.in_control = control
-            user_datastore.put(_u)
+            query = User.query.filter(User.id == user.id)
+            values = {User.in_control: False}
 
+        query.update(values, synchronize_session="fetch")
         self.app.server.user_datastore.commit()
+        self.invalidate_user_cache()
 
 
 class UserManager(BaseUserManager):
@@ -373,7 +435,7 @@ class UserManager(BaseUserManager):
         # Only allow remote logins with existing sessions
         if self.app.lims.lims_valid_login(login_res) and is_local_host():
             if not self.app.lims.lims_existing_session(login_res):
-                login_res = self.app.lims.create_lims_session(login_res)
+                login_res = self.app.lims.create_lims_session(login_res, login_id)
 
             msg = "[LOGIN] Valid login from local host (%s)" % str(info)
             logging.getLogger("MX3.HWR").info(msg)
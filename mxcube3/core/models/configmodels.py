@@ -48,11 +48,73 @@ class UserManagerConfigModel(BaseModel):
         True,
         description="Treat users defined as inhouse in session.xml as staff"
     )
+    retention_days: int = Field(
+        0,
+        description="Inactive session users and chat messages older than this "
+        "number of days are deleted from the user database, 0 (the default) "
+        "keeps everything",
+    )
+    retention_interval: float = Field(
+        24, description="Hours between two runs of the user database retention job"
+    )
     users: List[UserManagerUserConfigModel]
 
 
 class MXCUBEAppConfigModel(BaseModel):
     VIDEO_FORMAT: str = Field("MPEG1", description="Video format MPEG1 or MJPEG")
+    QUEUE_LOG_MODE: str = Field(
+        "diff",
+        description="Queue change logging, diff (one line per operation) or "
+        "full (also log the entire queue after each operation)",
+    )
+    BEAMLINE_ATTRIBUTE_MAX_AGE: float = Field(
+        10,
+        description="Time in seconds after which a cached beamline attribute "
+        "is read again from the hardware, in case a change was not signalled",
+    )
+    SESSION_STORE_PATH: str = Field(
+        "/tmp/stored-mxcube-session.json",
+        description="Snapshot file of the saved session state, changes are "
+        "appended to <SESSION_STORE_PATH>.journal",
+    )
+    SESSION_SAVE_DELAY: float = Field(
+        1.0,
+        description="Time in seconds changes of the session state are "
+        "collected before being saved",
+    )
+    SNAPSHOT_PATH: str = Field(
+        "/tmp/mxcube-session-snapshot.bin",
+        description="Binary snapshot of the queue and sample list",
+    )
+    SESSION_RESTORE: bool = Field(
+        False,
+        description="Restore the saved session state and queue on startup",
+    )
+    LOG_BUFFER_SIZE: int = Field(
+        1000, description="Number of log records kept for GET /log"
+    )
+    LOG_EMIT_LEVEL: str = Field(
+        "INFO", description="Lowest level of log records sent to the clients"
+    )
+    LOG_EMIT_INTERVAL: float = Field(
+        0.25, description="Time in seconds between log record batches"
+    )
+    LOG_EMIT_BATCH_SIZE: int = Field(
+        200,
+        description="Maximum number of log records sent in one batch, the "
+        "oldest records of a larger burst are only available through GET /log",
+    )
+    LOG_QUEUE_SIZE: int = Field(
+        10000,
+        description="Maximum number of log records waiting to be written, "
+        "further records are dropped",
+    )
+    EMIT_COALESCE_INTERVAL: float = Field(
+        0.1,
+        description="Interval in seconds at which high rate value updates "
+        "(motor positions, machine info ...) are sent to the clients, only the "
+        "latest update is sent. 0 sends every update",
+    )
     usermanager: UserManagerConfigModel
     ui_properties: Dict[str, UIPropertiesModel] = {}
     adapter_properties: List = []
@@ -59,11 +59,11 @@ class User(Base, UserMixin):
     last_login_ip = Column(String(100))
     current_login_ip = Column(String(100))
     login_count = Column(Integer)
-    active = Column(Boolean())
+    active = Column(Boolean(), index=True)
     fs_uniquifier = Column(String(255), unique=True, nullable=False)
     confirmed_at = Column(DateTime())
     requests_control = Column(Boolean(False))
-    in_control = Column(Boolean(False))
+    in_control = Column(Boolean(False), index=True)
     selected_proposal = Column(String(255), unique=False)
     proposal_list = Column(JSON, unique=False)
     current_limssession = Column(JSON, unique=False)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import copy
+import time
+
+import gevent
+from gevent.event import AsyncResult
+
+
+class TTLCache:
+    """
+    Cache for values fetched from slow external services (LIMS).
+
+    Values expire <ttl> seconds after they were fetched. Failed fetches are
+    cached as well (negative caching), for <negative_ttl> seconds, so that a
+    failing lookup is not retried on every call. Concurrent lookups of the
+    same key share one fetch (single-flight). Callers get copies of the
+    cached values so that they can modify them freely.
+    """
+
+    def __init__(self, ttl=60, negative_ttl=10, maxsize=1000, uncached_errors=()):
+        """
+        :param float ttl: Time in seconds a fetched value is kept
+        :param float negative_ttl: Time in seconds a failed fetch is kept
+        :param int maxsize: Maximum number of cached keys, the oldest
+                            entries are dropped first
+        :param tuple uncached_errors: Exception types of failed fetches that
+                                      are not cached (i.e. timeouts), the
+                                      next lookup fetches the value again
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.uncached_errors = uncached_errors
+        # key -> (expiry time, fetch succeeded, value)
+        self._entries = {}
+        # key -> AsyncResult of the fetch in progress
+        self._pending = {}
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def get(self, key, fetch, default=None, block=True):
+        """
+        :param key: Key of the value
+        :param callable fetch: Function fetching the value, called with <key>
+        :param default: Value returned if the fetch failed
+        :param bool block: Wait for the value if it is not cached, otherwise
+                           fetch it in the background and return the expired
+                           value, if any, or <default>
+        :returns: A copy of the value
+        """
+        entry = self._entries.get(key)
+
+        if entry and entry[0] > time.time():
+            self.stats["hits"] += 1
+            return self._value(entry, default)
+
+        self.stats["misses"] += 1
+        pending = self._pending.get(key)
+
+        if pending is None:
+            pending = AsyncResult()
+            self._pending[key] = pending
+
+            if block:
+                self._fetch(key, fetch, pending)
+            else:
+                gevent.spawn(self._fetch, key, fetch, pending)
+
+        if not block:
+            return self._value(entry, default) if entry else copy.deepcopy(default)
+
+        return self._value(pending.get(), default)
+
+    def invalidate(self, key=None):
+        """
+        Drops the cached value of <key>, all cached values if <key> is None
+        """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def _fetch(self, key, fetch, pending):
+        try:
+            entry = (time.time() + self.ttl, True, fetch(key))
+        except self.uncached_errors:
+            self.stats["errors"] += 1
+            self._pending.pop(key, None)
+            pending.set((0, False, None))
+            return
+        except Exception:
+            self.stats["errors"] += 1
+            entry = (time.time() + self.negative_ttl, False, None)
+
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+
+        while len(self._entries) > self.maxsize:
+            self._entries.pop(next(iter(self._entries)))
+
+        self._pending.pop(key, None)
+        pending.set(entry)
+
+    @staticmethod
+    def _value(entry, default):
+        _, ok, value = entry
+        return copy.deepcopy(value if ok else default)
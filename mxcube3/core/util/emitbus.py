@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import gevent
+
+from mxcubecore.BaseHardwareObjects import HardwareObjectState
+
+
+# Events that carry the current value (or state) of something rather than a
+# sequence of messages, only the latest one per key needs to reach the
+# clients. Maps event name to the field of the message identifying the
+# emitting object, None if there is only one emitter for the event.
+COALESCED_EVENTS = {
+    "beamline_value_change": "name",
+    "motor_position": "name",
+    "motor_state": "name",
+    "mach_info_changed": None,
+    "beam_changed": None,
+}
+
+BUSY_STATES = (HardwareObjectState.BUSY.name, HardwareObjectState.BUSY.value)
+
+
+class EmitBus:
+    """
+    Socket.IO emitter coalescing high rate value updates.
+
+    Messages of the events in COALESCED_EVENTS are buffered per (event,
+    namespace, room, key) and sent when the buffer is flushed, at most
+    <interval> seconds after the first buffered message. Messages with the
+    same key are merged, the fields of the later message replacing those of
+    the earlier one, so that a field only sent in one of them (i.e the state
+    of a value_change followed by a value only update) still reaches the
+    clients. Messages with a state that is not busy (i.e a motor that has
+    stopped moving) are merged with any buffered message for the same key and
+    sent straight away, so that the final value is never delayed or lost.
+    All other events are sent directly.
+    """
+
+    def __init__(self, emit, interval=0.1, coalesced_events=COALESCED_EVENTS):
+        """
+        :param callable emit: Function sending a message (SocketIO.emit)
+        :param float interval: Flush interval in seconds, 0 to disable
+                               coalescing
+        :param dict coalesced_events: event name to key field
+        """
+        self._emit = emit
+        self._interval = interval
+        self._events = coalesced_events
+        self._pending = {}
+        self._flush_task = None
+        self.stats = {"emitted": 0, "coalesced": 0}
+
+    def emit(self, event, *args, **kwargs):
+        if self._interval <= 0 or event not in self._events or not args:
+            self._send(event, args, kwargs)
+            return
+
+        data = args[0]
+        key = (
+            event,
+            kwargs.get("namespace"),
+            kwargs.get("room"),
+            self._message_key(event, data),
+        )
+
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+            buffered = self._pending[key][1][0]
+
+            if isinstance(buffered, dict) and isinstance(data, dict):
+                data = {**buffered, **data}
+                args = (data,) + args[1:]
+
+        if self._is_terminal(data):
+            self._pending.pop(key, None)
+            self._send(event, args, kwargs)
+        else:
+            self._pending[key] = (event, args, kwargs)
+
+            if self._flush_task is None:
+                self._flush_task = gevent.spawn_later(
+                    self._interval, self._scheduled_flush
+                )
+
+    def flush(self):
+        """
+        Sends all buffered messages
+        """
+        pending, self._pending = self._pending, {}
+
+        for event, args, kwargs in pending.values():
+            try:
+                self._send(event, args, kwargs)
+            except Exception:
+                logging.getLogger("MX3.HWR").exception(
+                    "Error sending %s message: %s" % (event, args)
+                )
+
+    def _scheduled_flush(self):
+        self._flush_task = None
+        self.flush()
+
+    def _send(self, event, args, kwargs):
+        self._emit(event, *args, **kwargs)
+        self.stats["emitted"] += 1
+
+    def _message_key(self, event, data):
+        field = self._events[event]
+
+        if field and isinstance(data, dict):
+            return data.get(field)
+
+        return None
+
+    @staticmethod
+    def _is_terminal(data):
+        state = data.get("state") if isinstance(data, dict) else None
+        return state is not None and state not in BUSY_STATES
@@ -1,4 +1,9 @@
 import os
+import json
+import logging
+import hashlib
+
+import gevent
 from scandir import scandir
 
 
@@ -22,3 +27,143 @@ def _scantree_rec(path, include=[], files=[]):
                 files.append(entry.path)
 
     return files
+
+
+class RunNumberIndex:
+    """
+    Highest run number of the image files on disk for each prefix path
+    (directory and prefix, as returned by PathTemplate.interpret_path).
+
+    The index is built by scanning a data directory in a separate thread,
+    kept current with add_path as collections finish and saved to a JSON
+    file per data directory, <path> % hash of the directory, so that it is
+    available straight away after a restart while the directory is scanned
+    again.
+    """
+
+    def __init__(self, interpret_path, path):
+        """
+        :param callable interpret_path: Function returning the tuple
+                                        (prefix path, run number, image
+                                        number) of a file path
+        :param str path: Path of the saved index, %s being replaced by a
+                         hash of the data directory
+        """
+        self._interpret_path = interpret_path
+        self._path = path
+        self._index = {}
+        self._root_path = None
+        self._fpath = None
+        self._build_task = None
+
+    def build(self, root_path, suffix):
+        """
+        Loads the saved index of <root_path> and scans <root_path> for
+        files with extension <suffix> in the background. Does nothing if the
+        index of <root_path> is already built or being built.
+
+        :param str root_path: Data directory
+        :param str suffix: Image file extension
+        """
+        if root_path == self._root_path:
+            return
+
+        self._root_path = root_path
+        self._fpath = self._path % hashlib.md5(root_path.encode()).hexdigest()
+        self._index = {}
+
+        try:
+            with open(self._fpath, "r") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        self._build_task = gevent.spawn(self._build, root_path, suffix)
+
+    def add_path(self, path):
+        """
+        Adds the file <path> (i.e. of a finished collection) to the index
+        """
+        parsed = self._parse(path)
+
+        if parsed is None:
+            logging.getLogger("MX3.HWR").info(
+                '[QUEUE] Warning, failed to interpret path: "%s", please check path'
+                % path
+            )
+        elif parsed[1] > self._index.get(parsed[0], 0):
+            self._index[parsed[0]] = parsed[1]
+            self._save()
+
+    def get(self, prefix_path):
+        """
+        :returns: The highest run number of <prefix_path>, 0 if none
+        """
+        return self._index.get(prefix_path, 0)
+
+    def _parse(self, path):
+        """
+        :returns: Tuple (prefix path, run number), None if <path> can not be
+                  interpreted
+        """
+        try:
+            prefix_path, run_number, _ = self._interpret_path(path)
+        except ValueError:
+            return None
+
+        return prefix_path, run_number
+
+    def _scan(self, root_path, suffix):
+        # Runs in a native thread, nothing is logged from here
+        index = {}
+        failed = 0
+
+        for path in scantree(root_path, [suffix]):
+            parsed = self._parse(path)
+
+            if parsed is None:
+                failed += 1
+            elif parsed[1] > index.get(parsed[0], 0):
+                index[parsed[0]] = parsed[1]
+
+        return index, failed
+
+    def _build(self, root_path, suffix):
+        # The file system is walked in a native thread, it would otherwise
+        # block all greenlets for the duration of the scan
+        index, failed = gevent.get_hub().threadpool.apply(
+            self._scan, (root_path, suffix)
+        )
+
+        if failed:
+            logging.getLogger("MX3.HWR").info(
+                "[QUEUE] Warning, failed to interpret %s paths in %s"
+                % (failed, root_path)
+            )
+
+        if root_path != self._root_path:
+            return
+
+        for prefix_path, run_number in index.items():
+            if run_number > self._index.get(prefix_path, 0):
+                self._index[prefix_path] = run_number
+
+        self._save()
+        logging.getLogger("MX3.HWR").info(
+            "[QUEUE] Indexed run numbers of %s prefixes in %s"
+            % (len(self._index), root_path)
+        )
+
+    def _save(self):
+        if not self._fpath:
+            return
+
+        try:
+            with open(self._fpath + ".tmp", "w") as f:
+                json.dump(self._index, f)
+
+            os.replace(self._fpath + ".tmp", self._fpath)
+        except OSError:
+            logging.getLogger("MX3.HWR").exception(
+                "[QUEUE] Could not save run number index"
+            )
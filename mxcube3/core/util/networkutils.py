@@ -6,6 +6,8 @@ import time
 import os
 import logging
 
+import gevent
+
 from email.mime.text import MIMEText
 from email.utils import make_msgid
 
@@ -16,27 +18,112 @@ from flask_login import current_user, login_required
 from mxcubecore import HardwareRepository as HWR
 
 
-def RateLimited(maxPerSecond):
+def RateLimited(maxPerSecond, key=None, trailing=True):
+    """
+    Limits the rate at which the decorated function is called to
+    <maxPerSecond>. The first call is made directly, calls made before the
+    interval has passed are suppressed. With trailing=True the latest
+    suppressed call is made once the interval has passed so that the last
+    value is always delivered.
+
+    The decorated function has the attributes:
+        stats: dict with the number of calls, delivered calls, coalesced
+               (superseded suppressed) calls and dropped calls
+        flush(key): make the pending trailing call for key now
+        cancel(key): drop the pending trailing call for key
+
+    :param float maxPerSecond: Maximum number of calls per second
+    :param callable key: Called with the arguments of each call, returns the
+                         key the rate is limited for, i.e instance_key to
+                         limit the rate per object. One limit for all calls if
+                         None
+    :param bool trailing: Make the last suppressed call
+    """
     minInterval = 1.0 / float(maxPerSecond)
 
     def decorate(func):
-        lastTimeCalled = [0.0]
-
+        lastTimeCalled = {}
+        pending = {}
+        lastEvicted = [0.0]
+        stats = {"calls": 0, "delivered": 0, "coalesced": 0, "dropped": 0}
+
+        def evict(now):
+            # Keys called longer than an interval ago are not limited anymore,
+            # forget them so that keys used once (i.e. one per queue entry)
+            # do not accumulate
+            lastEvicted[0] = now
+
+            for _key, t in list(lastTimeCalled.items()):
+                if now - t >= minInterval and _key not in pending:
+                    del lastTimeCalled[_key]
+
+        def call(_key, args, kargs):
+            lastTimeCalled[_key] = time.time()
+            stats["delivered"] += 1
+            return func(*args, **kargs)
+
+        def flush(_key=None):
+            call_args = pending.pop(_key, None)
+
+            if call_args is not None:
+                try:
+                    call(_key, *call_args)
+                except Exception:
+                    logging.getLogger("MX3.HWR").exception(
+                        "Error in rate limited call to %s" % func.__name__
+                    )
+
+        def cancel(_key=None):
+            if pending.pop(_key, None) is not None:
+                stats["dropped"] += 1
+
+        @functools.wraps(func)
         def rateLimitedFunction(*args, **kargs):
-            elapsed = time.time() - lastTimeCalled[0]
+            _key = key(*args, **kargs) if key else None
+            stats["calls"] += 1
+            now = time.time()
+
+            if now - lastEvicted[0] >= minInterval:
+                evict(now)
+
+            elapsed = now - lastTimeCalled.get(_key, 0.0)
             leftToWait = minInterval - elapsed
+
             if leftToWait > 0:
-                # ignore update
+                if not trailing:
+                    # ignore update
+                    stats["dropped"] += 1
+                elif _key in pending:
+                    stats["coalesced"] += 1
+                    pending[_key] = (args, kargs)
+                else:
+                    pending[_key] = (args, kargs)
+                    gevent.spawn_later(leftToWait, flush, _key)
+
                 return
-            ret = func(*args, **kargs)
-            lastTimeCalled[0] = time.time()
-            return ret
+
+            # This call supersedes a trailing call that is late
+            if pending.pop(_key, None) is not None:
+                stats["coalesced"] += 1
+
+            return call(_key, args, kargs)
+
+        rateLimitedFunction.stats = stats
+        rateLimitedFunction.flush = flush
+        rateLimitedFunction.cancel = cancel
 
         return rateLimitedFunction
 
     return decorate
 
 
+def instance_key(obj, *args, **kwargs):
+    """
+    RateLimited key, limits the rate of a method per object
+    """
+    return id(obj)
+
+
 def remote_addr():
     hdr = flask.request.headers.get("x-forwarded-for", flask.request.remote_addr)
 
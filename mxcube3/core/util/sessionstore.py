@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import logging
+
+import gevent
+from gevent.lock import RLock
+
+
+class SessionStore:
+    """
+    Persistent key/value store for the application session state.
+
+    The store consists of a snapshot, <path>, holding the complete state and
+    an append-only journal, <path>.journal, with one JSON record per line
+    for each key changed since the snapshot was written. Saves are debounced,
+    touch() schedules a save <delay> seconds later and only the keys whose
+    serialized value changed since the last save are appended to the
+    journal. Once the journal holds more than <compact_size> records it is
+    folded into a new snapshot, written to a temporary file and atomically
+    renamed, so that a crash at any point leaves a loadable store.
+    """
+
+    def __init__(self, path, provider, delay=1.0, compact_size=500, on_save=None):
+        """
+        :param str path: Path of the snapshot file
+        :param callable provider: Function returning the state to save, a
+                                  dict with JSON serializable values
+        :param callable on_save: Function called after each save, for state
+                                 persisted outside of the store
+        :param float delay: Debounce time in seconds
+        :param int compact_size: Number of journal records after which the
+                                 journal is compacted
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self._provider = provider
+        self._on_save = on_save
+        self._delay = delay
+        self._compact_size = compact_size
+        self._lock = RLock()
+        self._save_task = None
+        # Serialized value of each key as last written
+        self._data = {}
+        self._journal_size = 0
+        # False until the files on disk reflect _data (after load or compact)
+        self._synced = False
+
+    def load(self):
+        """
+        Reads the snapshot and replays the journal on top of it. A record
+        truncated by a crash (the last line) is ignored and the store is
+        compacted, so that new records are not appended to the broken line.
+
+        :returns: dict key -> value
+        """
+        data = {}
+
+        with self._lock:
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                pass
+            except ValueError:
+                logging.getLogger("MX3.HWR").exception(
+                    "Could not read session snapshot %s" % self.path
+                )
+
+            self._journal_size = 0
+            truncated = False
+
+            try:
+                with open(self.journal_path, "rb") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            key = record["key"]
+                        except (ValueError, KeyError, TypeError):
+                            truncated = True
+                            break
+
+                        if record.get("deleted", False):
+                            data.pop(key, None)
+                        else:
+                            data[key] = record.get("value")
+
+                        self._journal_size += 1
+            except FileNotFoundError:
+                pass
+
+            self._data = {key: json.dumps(value) for key, value in data.items()}
+            self._synced = True
+
+            if truncated:
+                logging.getLogger("MX3.HWR").warning(
+                    "Session journal %s truncated after %s records"
+                    % (self.journal_path, self._journal_size)
+                )
+                self.compact()
+
+        return data
+
+    def touch(self):
+        """
+        Schedules a save, calls within the debounce time are merged into one
+        """
+        if self._save_task is None:
+            self._save_task = gevent.spawn_later(self._delay, self._scheduled_save)
+
+    def save(self, data=None):
+        """
+        Appends the keys of <data> (by default the state returned by the
+        provider) that changed since the last save to the journal, keys no
+        longer present are recorded as deleted.
+
+        :param dict data: State to save
+        """
+        with self._lock:
+            if data is None:
+                data = self._provider()
+
+            records = []
+
+            for key in list(self._data.keys()):
+                if key not in data:
+                    records.append(json.dumps({"key": key, "deleted": True}))
+                    self._data.pop(key)
+
+            for key, value in data.items():
+                serialized = json.dumps(value)
+
+                if self._data.get(key) != serialized:
+                    records.append(
+                        '{"key": %s, "value": %s}' % (json.dumps(key), serialized)
+                    )
+                    self._data[key] = serialized
+
+            if not self._synced:
+                # Written over a store that was never loaded, replace it
+                # rather than journaling on top of unrelated keys
+                self.compact()
+            elif records:
+                with open(self.journal_path, "a") as f:
+                    f.write("\n".join(records) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                self._journal_size += len(records)
+
+            if self._journal_size > self._compact_size:
+                self.compact()
+
+            if self._on_save:
+                self._on_save()
+
+    def compact(self):
+        """
+        Writes the complete state to a new snapshot and empties the journal
+        """
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            items = ", ".join(
+                "%s: %s" % (json.dumps(key), value) for key, value in self._data.items()
+            )
+
+            with open(tmp_path, "w") as f:
+                f.write("{%s}" % items)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tmp_path, self.path)
+
+            # The snapshot already contains every journaled record, a crash
+            # before the truncation only causes them to be replayed again
+            with open(self.journal_path, "w") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._journal_size = 0
+            self._synced = True
+
+    def close(self):
+        """
+        Saves pending changes, to be called on shutdown
+        """
+        if self._save_task is not None:
+            self._save_task.kill()
+            self._save_task = None
+
+        self.save()
+
+    def _scheduled_save(self):
+        self._save_task = None
+
+        try:
+            self.save()
+        except Exception:
+            logging.getLogger("MX3.HWR").exception("Could not save session state")
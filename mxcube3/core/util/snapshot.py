@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+
+import msgpack
+
+# File signature and format version, a snapshot written with another
+# version is not loaded
+SNAPSHOT_MAGIC = b"MX3S"
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct(">4sH")
+
+
+def dump_snapshot(path, data):
+    """
+    Writes <data> to the snapshot file <path> (msgpack encoded, preceded by
+    the file signature and format version). The file is written to a
+    temporary file first and renamed, so <path> always holds a complete
+    snapshot.
+
+    :param str path: Path of the snapshot file
+    :param dict data: Data to save, dicts may have integer keys
+    """
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+        f.write(msgpack.packb(data, use_bin_type=True))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """
+    Reads the snapshot file <path>
+
+    :param str path: Path of the snapshot file
+    :returns: The saved data, None if there is no snapshot
+    :raises ValueError: If the file is not a snapshot of the current version
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+
+    if len(raw) < _HEADER.size:
+        raise ValueError("%s is not a snapshot file" % path)
+
+    magic, version = _HEADER.unpack_from(raw)
+
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("%s is not a snapshot file" % path)
+
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(
+            "Snapshot %s has version %s, expected %s"
+            % (path, version, SNAPSHOT_VERSION)
+        )
+
+    return msgpack.unpackb(raw[_HEADER.size :], raw=False, strict_map_key=False)
@@ -1,12 +1,45 @@
+import queue
 import logging
+import itertools
 import traceback
+import logging.handlers
+
+from collections import deque
+
+import gevent
 from flask_login import current_user
 
 
-class MX3LoggingHandler(logging.handlers.BufferingHandler):
-    def __init__(self, server):
-        super().__init__(1000)
+class MX3LoggingHandler(logging.Handler):
+    """
+    Keeps the last <capacity> log records in a ring buffer, for GET /log,
+    and forwards them to the clients (the /logging namespace).
+
+    Records are numbered, the number (id) of a record serves as cursor when
+    paging through the buffer. Records at or above <emit_level> are sent to
+    the clients in batches, one "log_records" message every <interval>
+    seconds with at most <batch_size> records. During bursts the oldest
+    pending records are left out of the batch (but kept in the buffer) and
+    the number of records left out is counted in <skipped>.
+    """
+
+    def __init__(
+        self,
+        server,
+        capacity=1000,
+        emit_level=logging.INFO,
+        interval=0.25,
+        batch_size=200,
+    ):
+        super().__init__()
         self.server = server
+        self.buffer = deque(maxlen=capacity)
+        self.emit_level = logging._checkLevel(emit_level)
+        self.skipped = 0
+        self._interval = interval
+        self._pending = deque(maxlen=batch_size)
+        self._ids = itertools.count(1)
+        self._emit_task = gevent.spawn(self._emit_loop)
 
         @server.flask_socketio.on("connect", namespace="/logging")
         @server.ws_restrict
@@ -17,24 +50,139 @@ class MX3LoggingHandler(logging.handlers.BufferingHandler):
         if record.exc_info:
             stack_trace = "".join(traceback.format_exception(*record.exc_info))
         else:
-            stack_trace = ""
+            # Set instead of exc_info for records passed through MX3QueueHandler
+            stack_trace = record.exc_text or ""
         try:
             record.asctime
         except AttributeError:
             record.asctime = logging._defaultFormatter.formatTime(record)
 
         return {
+            "id": next(self._ids),
             "message": record.getMessage(),
             "severity": record.levelname,
+            "level": record.levelno,
             "timestamp": record.asctime,
             "logger": record.name,
             "stack_trace": stack_trace,
         }
 
     def emit(self, record):
-        if record.name != "geventwebsocket.handler":
-            record_dict = self._record_to_json(record)
-            super().emit(record_dict)
-            self.server.emit("log_record", record_dict, namespace="/logging")
-        else:
-            super().emit(record)
+        if record.name == "geventwebsocket.handler":
+            return
+
+        record_dict = self._record_to_json(record)
+        self.buffer.append(record_dict)
+
+        if record.levelno >= self.emit_level:
+            if len(self._pending) == self._pending.maxlen:
+                self.skipped += 1
+
+            self._pending.append(record_dict)
+
+    def get_records(self, after=None, before=None, limit=None, level=None, logger=None):
+        """
+        Records in the buffer, oldest first
+
+        :param int after: Only records with an id greater than <after>
+        :param int before: Only records with an id smaller than <before>
+        :param int limit: At most <limit> records, the newest ones unless
+                          <after> is given
+        :param int level: Only records at or above <level>
+        :param str logger: Only records of <logger> and its children
+        :returns: dict {"records": [...], "more": bool}
+        """
+        level = logging._checkLevel(level) if level is not None else None
+        records = []
+
+        for record in list(self.buffer):
+            if after is not None and record["id"] <= after:
+                continue
+            if before is not None and record["id"] >= before:
+                continue
+            if level is not None and record["level"] < level:
+                continue
+            if logger and not (
+                record["logger"] == logger
+                or record["logger"].startswith(logger + ".")
+            ):
+                continue
+
+            records.append(record)
+
+        more = False
+
+        if limit is not None and len(records) > limit:
+            more = True
+            records = records[:limit] if after is not None else records[-limit:]
+
+        return {"records": records, "more": more}
+
+    def flush(self):
+        """
+        Sends the pending records to the clients
+        """
+        records = []
+
+        while self._pending:
+            records.append(self._pending.popleft())
+
+        if records:
+            self.server.emit("log_records", records, namespace="/logging")
+
+    def close(self):
+        self._emit_task.kill()
+        super().close()
+
+    def _emit_loop(self):
+        while True:
+            gevent.sleep(self._interval)
+
+            try:
+                self.flush()
+            except Exception:
+                # Can't log this, it would come back here
+                pass
+
+
+class MX3QueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts log records on a bounded queue, processed by a QueueListener in a
+    separate thread, so that logging never waits for the file, stdout or
+    socket handlers.
+
+    When the queue is full, records below WARNING are dropped straight away
+    and other records wait at most <timeout> seconds for room before being
+    dropped. Dropped records are counted in <dropped>.
+    """
+
+    def __init__(self, log_queue, timeout=1.0):
+        super().__init__(log_queue)
+        self.timeout = timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message and exception now, the arguments and traceback
+        # may not be picklable or valid anymore when the record is handled.
+        # Unlike QueueHandler.prepare the traceback is kept apart (exc_text)
+        # so that the handlers can still format it separately.
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging._defaultFormatter.formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
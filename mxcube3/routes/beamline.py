@@ -130,6 +130,35 @@ def init_route(app, server, url_prefix):
     def beamline_get_all_attributes():
         return jsonify(app.beamline.beamline_get_all_attributes())
 
+    @bp.route("/attributes", methods=["GET"])
+    @server.restrict
+    def beamline_get_attributes():
+        """
+        Retrieves the beamline attributes, the ETag of the reply is the
+        version of the attributes. If the If-None-Match header is set to the
+        ETag of a previous reply only the attributes changed since are
+        returned.
+
+        Replies with status code 200 on success and 304 if nothing changed.
+        """
+        etags = request.if_none_match.as_set()
+        since = None
+
+        if len(etags) == 1:
+            try:
+                since = int(etags.pop())
+            except ValueError:
+                pass
+
+        data = app.beamline.beamline_get_attributes(since)
+
+        if since is not None and not data["attributes"]:
+            resp = make_response("", 304)
+        else:
+            resp = jsonify(data)
+
+        resp.set_etag(str(data["version"]))
+        return resp
 
     @bp.route("/<name>/abort", methods=["GET"])
     @server.require_control
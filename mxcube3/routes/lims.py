@@ -49,7 +49,7 @@ def init_route(app, server, url_prefix):
     @bp.route("/dc/<dc_id>", methods=["GET"])
     @server.restrict
     def get_dc(dc_id):
-        data = HWR.beamline.lims_rest.get_dc(dc_id)
+        data = app.lims.get_dc_result(dc_id)
         return jsonify(data)
 
     @bp.route("/proposal", methods=["POST"])
@@ -1,6 +1,7 @@
-import logging
-from flask import Blueprint, jsonify
-from mxcube3 import logging_handler
+from flask import Blueprint, jsonify, make_response, request
+
+# Default number of log records returned by GET /log
+LOG_PAGE_SIZE = 200
 
 
 def init_route(app, server, url_prefix):
@@ -10,13 +11,36 @@ def init_route(app, server, url_prefix):
     @server.restrict
     def log():
         """
-        Retrive log messages
+        Retrive log messages, the last <limit> (default 200) records,
+        optionally only those newer than the record with id <after> or older
+        than the record with id <before>, at or above <level> and/or from
+        <logger>.
+
+        :returns: {"records": [...], "more": bool, "dropped": int}, dropped
+                  being the number of records lost because the log queue was
+                  full
         """
-        messages = []
+        after = request.args.get("after", None, type=int)
+        before = request.args.get("before", None, type=int)
+        limit = request.args.get("limit", LOG_PAGE_SIZE, type=int)
+        level = request.args.get("level", None)
+        logger = request.args.get("logger", None)
+
+        if level is not None and level.isdigit():
+            level = int(level)
+
+        messages = {"records": [], "more": False, "dropped": 0}
+
+        if app.log_handler:
+            try:
+                messages.update(
+                    app.log_handler.get_records(after, before, limit, level, logger)
+                )
+            except ValueError as ex:
+                return make_response(str(ex), 409)
 
-        for handler in logging.getLogger("MX3.HWR").handlers:
-            if isinstance(handler, logging_handler.MX3LoggingHandler):
-                messages = handler.buffer
+        if app.log_queue_handler:
+            messages["dropped"] = app.log_queue_handler.dropped
 
         return jsonify(messages)
 
@@ -1,6 +1,6 @@
 import json
 
-from flask import Blueprint, Response, jsonify, request, session
+from flask import Blueprint, Response, jsonify, make_response, request, session
 
 from mxcubecore import HardwareRepository as HWR
 
@@ -112,6 +112,27 @@ def init_route(app, server, url_prefix):
         resp.status_code = 200
         return resp
 
+    @bp.route("/dump", methods=["GET"])
+    @server.restrict
+    def queue_dump():
+        """
+        Get the entire queue as formatted JSON, for inspection and debugging
+        :returns: Response object response Content-Type: application/json
+        """
+        return Response(app.queue.queue_to_json(), mimetype="application/json")
+
+    @bp.route("/changes", methods=["GET"])
+    @server.restrict
+    def queue_get_changes():
+        """
+        Get the log of the last operations applied to the queue
+        :returns: Response object response Content-Type: application/json,
+                  {"changes": [{op, queueID, sample, fields, timestamp ...}]}
+        """
+        resp = jsonify({"changes": app.queue.get_change_log()})
+        resp.status_code = 200
+        return resp
+
     @bp.route("/queue_state", methods=["GET"])
     @server.restrict
     def queue_get_state():
@@ -220,6 +241,31 @@ def init_route(app, server, url_prefix):
         app.queue.move_task_entry(sid, int(ti1), int(ti2))
         return Response(status=200)
 
+    @bp.route("/batch", methods=["POST"])
+    @server.require_control
+    @server.restrict
+    def queue_batch():
+        """
+        Apply a list of queue operations (delete, set_enabled, swap, move,
+        sample_order) in one request, see Queue.apply_batch for the format
+        of the operations.
+
+        :returns: Response object response Content-Type: application/json,
+                  {"sampleOrder": [...], "samples": {...}, "removed": [...]}
+                  The status code is set to:
+
+                  200: On success
+                  409: Invalid batch, the queue was not modified
+        """
+        try:
+            diff = app.queue.apply_batch(request.get_json())
+        except ValueError as ex:
+            return make_response(str(ex), 409)
+
+        resp = jsonify(diff)
+        resp.status_code = 200
+        return resp
+
     @bp.route("/sample-order", methods=["POST"])
     @server.require_control
     @server.restrict
@@ -16,6 +16,9 @@ from flask_login import current_user
 
 DISCONNECT_HANDLED = True
 
+# Default number of chat messages returned by GET /ra/chat
+CHAT_PAGE_SIZE = 50
+
 
 def init_route(app, server, url_prefix):
     bp = Blueprint("remote_access", __name__, url_prefix=url_prefix)
@@ -203,7 +206,17 @@ def init_route(app, server, url_prefix):
     @bp.route("/chat", methods=["GET"])
     @server.restrict
     def get_all_mesages():
-        return jsonify({"messages": app.chat.get_all_messages()})
+        """
+        Page of the chat history, the last <limit> (default 50) messages,
+        optionally only those older than the message with id <before>. If
+        only <since> is given the first <limit> messages newer than the
+        message with id <since> are returned.
+        """
+        since = request.args.get("since", None, type=int)
+        before = request.args.get("before", None, type=int)
+        limit = request.args.get("limit", CHAT_PAGE_SIZE, type=int)
+
+        return jsonify(app.chat.get_messages(since, before, limit))
 
     @server.flask_socketio.on("connect", namespace="/hwr")
     @server.ws_restrict
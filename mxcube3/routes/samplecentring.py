@@ -5,6 +5,8 @@ from flask import Blueprint, Response, jsonify, request
 
 from mxcubecore import HardwareRepository as HWR
 
+from mxcube3.video import streaming_processes
+
 
 def init_route(app, server, url_prefix):
     bp = Blueprint("sampleview", __name__, url_prefix=url_prefix)
@@ -37,6 +39,19 @@ def init_route(app, server, url_prefix):
         HWR.beamline.sample_view.camera.streaming_greenlet.kill()
         return Response(status=200)
 
+    @bp.route("/camera/metrics", methods=["GET"])
+    @server.restrict
+    def get_camera_metrics():
+        """
+        Metrics of the video streaming processes (state, fps, latency,
+        restarts ...), empty if the stream is not supervised
+        """
+        resp = jsonify(
+            streaming_processes.read_metrics(HWR.beamline.sample_view.camera.stream_hash)
+        )
+        resp.status_code = 200
+        return resp
+
     @bp.route("/camera/save", methods=["PUT"])
     @server.restrict
     def snapshot():
@@ -80,7 +95,7 @@ def init_route(app, server, url_prefix):
         params = request.get_json()
 
         res = app.sample_view.set_image_size(
-            int(params["width"]), int(params["height"])
+            int(params["width"]), int(params["height"]), params.get("rendition")
         )
 
         resp = jsonify(res)
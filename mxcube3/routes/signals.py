@@ -1,6 +1,8 @@
 import logging
 import json
 
+import gevent
+
 from mxcube3 import server
 from mxcube3 import mxcube
 
@@ -223,17 +225,9 @@ def get_task_state(entry):
     node_index = mxcube.queue.node_index(entry.get_data_model())
     lims_id = mxcube.NODE_ID_TO_LIMS_ID.get(node_id, "null")
 
-    try:
-        limsres = HWR.beamline.lims.lims_rest.get_dc(lims_id)
-    except BaseException:
-        limsres = {}
-
-    try:
-        limsres["limsTaskLink"] = mxcube.lims.get_dc_link(lims_id)
-    except Exception:
-        limsres["limsTaskLink"] = "#"
-        msg = "Could not get lims link for collection with id: %s" % lims_id
-        logging.getLogger("HWR").error(msg)
+    # Called from the queue entry callbacks, never wait for LIMS, the cached
+    # result (if any) is used and fetched in the background otherwise
+    limsres = mxcube.lims.get_dc(lims_id, block=False)
 
     msg = {
         "Signal": "",
@@ -253,18 +247,7 @@ def update_task_result(entry):
     node_index = mxcube.queue.node_index(entry.get_data_model())
     node_id = entry.get_data_model()._node_id
     lims_id = mxcube.NODE_ID_TO_LIMS_ID.get(node_id, "null")
-
-    try:
-        limsres = HWR.beamline.lims_rest.get_dc(lims_id)
-    except BaseException:
-        limsres = {}
-
-    try:
-        limsres["limsTaskLink"] = mxcube.lims.get_dc_link(lims_id)
-    except Exception:
-        limsres["limsTaskLink"] = "#"
-        msg = "Could not get lims link for collection with id: %s" % lims_id
-        logging.getLogger("HWR").error(msg)
+    limsres = mxcube.lims.get_dc(lims_id)
 
     msg = {
         "sample": node_index["sample"],
@@ -276,6 +259,7 @@ def update_task_result(entry):
 
 
 def queue_execution_entry_started(entry, message=None):
+    mxcube.queue.invalidate_snapshot(entry.get_data_model())
     handle_auto_mount_next(entry)
 
     if not mxcube.queue.is_interleaved(entry.get_data_model()):
@@ -283,6 +267,7 @@ def queue_execution_entry_started(entry, message=None):
 
 
 def queue_execution_entry_finished(entry, message):
+    mxcube.queue.invalidate_snapshot(entry.get_data_model())
     handle_auto_mount_next(entry)
 
     if not mxcube.queue.is_interleaved(entry.get_data_model()):
@@ -301,6 +286,7 @@ def queue_execution_started(entry, queue_state=None):
     state = queue_state if queue_state else mxcube.queue.queue_exec_state()
     msg = {"Signal": state, "Message": "Queue execution started"}
 
+    mxcube.queue.invalidate_snapshot()
     server.emit("queue", msg, namespace="/hwr")
 
 
@@ -310,12 +296,14 @@ def queue_execution_finished(entry, queue_state=None):
 
     mxcube.queue.enable_sample_entries(mxcube.TEMP_DISABLED, True)
     mxcube.TEMP_DISABLED = []
+    mxcube.queue.invalidate_snapshot()
 
     server.emit("queue", msg, namespace="/hwr")
 
 
 def queue_execution_stopped(*args):
     msg = {"Signal": "QueueStopped", "Message": "Queue execution stopped"}
+    mxcube.queue.invalidate_snapshot()
 
     server.emit("queue", msg, namespace="/hwr")
 
@@ -335,6 +323,8 @@ def queue_execution_failed(entry):
         "Message": "Queue execution stopped",
     }
 
+    mxcube.queue.invalidate_snapshot()
+
     server.emit("queue", msg, namespace="/hwr")
 
 
@@ -364,7 +354,7 @@ def collect_image_taken(frame):
     node = last_queue_node()
 
     if not mxcube.queue.is_interleaved(node["node"]):
-        progress = mxcube.queue.get_task_progress(last_queue_node()["node"], frame)
+        progress = mxcube.queue.get_task_progress(node["node"], frame)
 
         msg = {
             "Signal": "collectImageTaken",
@@ -381,7 +371,7 @@ def collect_image_taken(frame):
             logging.getLogger("HWR").error("error sending message: " + str(msg))
 
 
-@RateLimited(1)
+@RateLimited(1, key=lambda msg: msg["queueID"])
 def _emit_progress(msg):
     logging.getLogger("HWR").debug("[TASK CALLBACK] " + str(msg))
     server.emit("task", msg, namespace="/hwr")
@@ -393,12 +383,13 @@ def collect_oscillation_failed(
     node = last_queue_node()
 
     mxcube.NODE_ID_TO_LIMS_ID[node["queue_id"]] = lims_id
+    mxcube.queue.invalidate_snapshot(node["node"])
+    mxcube.lims.dc_result_invalidate(lims_id)
 
     if not mxcube.queue.is_interleaved(node["node"]):
-        try:
-            HWR.beamline.lims_rest.get_dc(lims_id)
-        except BaseException:
-            pass
+        # Fetch the collection data in the background and send it to the
+        # clients when available
+        gevent.spawn(update_task_result, mxcube.queue.get_entry(node["queue_id"])[1])
 
         msg = {
             "Signal": "collectOscillationFailed",
@@ -412,6 +403,9 @@ def collect_oscillation_failed(
 
         logging.getLogger("HWR").debug("[TASK CALLBACK] " + str(msg))
 
+        # The final state replaces any pending progress update
+        _emit_progress.cancel(node["queue_id"])
+
         try:
             server.emit("task", msg, namespace="/hwr")
         except Exception:
@@ -421,9 +415,13 @@ def collect_oscillation_failed(
 def collect_oscillation_finished(owner, status, state, lims_id, osc_id, params):
     node = last_queue_node()
     mxcube.NODE_ID_TO_LIMS_ID[node["queue_id"]] = lims_id
+    mxcube.queue.invalidate_snapshot(node["node"])
+    mxcube.queue.add_collected_files(node["node"])
+    mxcube.lims.dc_result_invalidate(lims_id)
 
     if not mxcube.queue.is_interleaved(node["node"]):
         mxcube.queue.enable_entry(node["queue_id"], False)
+        gevent.spawn(update_task_result, mxcube.queue.get_entry(node["queue_id"])[1])
 
         msg = {
             "Signal": "collectOscillationFinished",
@@ -437,6 +435,9 @@ def collect_oscillation_finished(owner, status, state, lims_id, osc_id, params):
 
         logging.getLogger("HWR").debug("[TASK CALLBACK] " + str(msg))
 
+        # The final state replaces any pending progress update
+        _emit_progress.cancel(node["queue_id"])
+
         try:
             server.emit("task", msg, namespace="/hwr")
         except Exception:
@@ -461,6 +462,9 @@ def collect_ended(owner, success, message):
 
         logging.getLogger("HWR").debug("[TASK CALLBACK] " + str(msg))
 
+        # The final state replaces any pending progress update
+        _emit_progress.cancel(node["queue_id"])
+
         try:
             server.emit("task", msg, namespace="/hwr")
         except Exception:
@@ -475,9 +479,9 @@ def collect_started(*args, **kwargs):
         msg = {
             "Signal": kwargs["signal"],
             "Message": task_signals[kwargs["signal"]],
-            "taskIndex": last_queue_node()["idx"],
-            "queueID": last_queue_node()["queue_id"],
-            "sample": last_queue_node()["sample"],
+            "taskIndex": node["idx"],
+            "queueID": node["queue_id"],
+            "sample": node["sample"],
             "state": RUNNING,
             "progress": 0,
         }
@@ -703,13 +707,19 @@ def new_plot(plot_info):
         logging.getLogger("HWR").error("error sending new_plot message: %s", plot_info)
 
 
-@RateLimited(1)
-def plot_data(data, last_index=[0], **kwargs):
+# Number of points of each plot already sent, by plot id
+_plot_last_index = {}
+
+
+@RateLimited(1, key=lambda data, *args, **kwargs: data["id"])
+def plot_data(data, **kwargs):
     data_data = data["data"]
-    if last_index[0] > len(data_data):
-        last_index = [0]
+    last_index = _plot_last_index.get(data["id"], 0)
 
-    data["data"] = data_data[last_index[0] :]
+    if last_index > len(data_data):
+        last_index = 0
+
+    data["data"] = data_data[last_index:]
 
     try:
         server.emit("plot_data", data, namespace="/hwr")
@@ -718,10 +728,14 @@ def plot_data(data, last_index=[0], **kwargs):
             "error sending plot_data message for plot %s", data["id"]
         )
     else:
-        last_index[0] += len(data_data)
+        _plot_last_index[data["id"]] = len(data_data)
 
 
 def plot_end(data):
+    # Send the last points of the plot before ending it
+    plot_data.flush(data["id"])
+    _plot_last_index.pop(data["id"], None)
+
     try:
         server.emit("plot_end", data, namespace="/hwr")
     except Exception:
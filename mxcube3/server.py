@@ -16,8 +16,10 @@ import flask_security
 from spectree import SpecTree
 
 from mxcube3.core.util import networkutils
+from mxcube3.core.util.emitbus import EmitBus
 from mxcube3.core.components.user.database import db_session, init_db, UserDatastore
 from mxcube3.core.models.usermodels import User, Role, Message
+from mxcube3.video.streaming_processes import STOP_TIMEOUT
 
 
 class Server:
@@ -28,6 +30,11 @@ class Server:
     api = None
     user_datastore = None
     db_session = None
+    emit_bus = None
+
+    # Seconds the other processes get to exit after SIGTERM, long enough for
+    # the streaming supervisor to stop its processes (STOP_TIMEOUT)
+    KILL_TIMEOUT = STOP_TIMEOUT + 2
 
     @staticmethod
     def exception_handler(e):
@@ -42,15 +49,49 @@ class Server:
         # when running the tests
         if not Server.flask.testing:
             with open("/tmp/mxcube.pid", "r") as f:
-                pid_list = f.read().strip()
-                pid_list = pid_list.split(" ")
+                pid_list = [int(pid) for pid in f.read().split()]
                 pid_list.reverse()
 
             with open("/tmp/mxcube.pid", "w") as f:
                 f.write("")
 
-            for pid in pid_list:
-                os.kill(int(pid), signal.SIGKILL)
+            # Ask the other processes (i.e the streaming supervisor, that
+            # stops its relay and encoder processes) to terminate first
+            others = [pid for pid in pid_list if pid != os.getpid()]
+
+            for pid in others:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+            t0 = time.time()
+
+            while others and time.time() - t0 < Server.KILL_TIMEOUT:
+                others = [pid for pid in others if Server._is_running(pid)]
+                time.sleep(0.1)
+
+            for pid in others + [pid for pid in pid_list if pid == os.getpid()]:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    @staticmethod
+    def _is_running(pid):
+        # Reap the process if it is a child that has exited
+        try:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                return False
+        except ChildProcessError:
+            pass
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+
+        return True
 
     @staticmethod
     def init(cmdline_options, cfg, mxcube):
@@ -73,6 +114,9 @@ class Server:
             manage_session=False, cors_allowed_origins=cfg.flask.ALLOWED_CORS_ORIGINS
         )
         Server.flask_socketio.init_app(Server.flask)
+        Server.emit_bus = EmitBus(
+            Server.flask_socketio.emit, cfg.app.EMIT_COALESCE_INTERVAL
+        )
 
         Server.api = SpecTree(
             "flask",
@@ -186,7 +230,7 @@ class Server:
 
     @staticmethod
     def emit(*args, **kwargs):
-        Server.flask_socketio.emit(*args, **kwargs)
+        Server.emit_bus.emit(*args, **kwargs)
 
     @staticmethod
     def run():
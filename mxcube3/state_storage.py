@@ -8,6 +8,65 @@ import json
 
 def flush():
     mxcube.UI_STATE = dict()
+    mxcube.UI_STATE_VERSION += 1
+
+
+def _escape(key):
+    # JSON pointer escaping (RFC 6901)
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def json_diff(old, new, path=""):
+    """
+    List of JSON patch (RFC 6902) operations turning <old> into <new>.
+    Objects are compared recursively, any other value (including lists) that
+    differs is replaced as a whole.
+
+    :param old: previous value
+    :param new: new value
+    :param str path: JSON pointer of the compared values
+    :returns: list of {"op", "path", ["value"]} dicts
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": path + "/" + _escape(key)})
+
+        for key, value in new.items():
+            _path = path + "/" + _escape(key)
+
+            if key not in old:
+                ops.append({"op": "add", "path": _path, "value": value})
+            else:
+                ops.extend(json_diff(old[key], value, _path))
+
+        return ops
+
+    if old == new and type(old) == type(new):
+        return []
+
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def emit_patch(key, patch):
+    """
+    Sends the changes of the UI state <key> to the observers, the clients
+    apply the patches in version order and request the complete state
+    (ui_state_sync) when they miss one.
+    """
+    mxcube.UI_STATE_VERSION += 1
+
+    emit(
+        "state_patch",
+        {"version": mxcube.UI_STATE_VERSION, "key": key, "patch": patch},
+        namespace="/ui_state",
+        room="observers",
+        include_self=False,
+    )
+
+    mxcube.save_settings(delayed=True)
 
 
 def init():
@@ -30,21 +89,31 @@ def init():
     def ui_state_rm(k):
         k = k.replace("reduxPersist:", "")
         # print 'ui state REMOVE',k
-        del mxcube.UI_STATE[k]
+        if mxcube.UI_STATE.pop(k, None) is not None:
+            emit_patch(k, [{"op": "remove", "path": ""}])
 
     @server.flask_socketio.on("ui_state_set", namespace="/ui_state")
     def ui_state_update(key_val):
         key, val = key_val
-        mxcube.UI_STATE[key.replace("reduxPersist:", "")] = json.loads(val)
-        operator = mxcube.usermanager.get_operator()
-
-        emit(
-            "state_update",
-            json.dumps(mxcube.UI_STATE),
-            namespace="/ui_state",
-            room="observers",
-            include_self=False,
-        )
+        key = key.replace("reduxPersist:", "")
+        val = json.loads(val)
+
+        if key in mxcube.UI_STATE:
+            patch = json_diff(mxcube.UI_STATE[key], val)
+        else:
+            patch = [{"op": "add", "path": "", "value": val}]
+
+        mxcube.UI_STATE[key] = val
+
+        if patch:
+            emit_patch(key, patch)
+
+    @server.flask_socketio.on("ui_state_sync", namespace="/ui_state")
+    def ui_state_sync(*args):
+        """
+        Complete UI state and its version, for clients that are out of sync
+        """
+        return {"version": mxcube.UI_STATE_VERSION, "state": mxcube.UI_STATE}
 
     @server.flask_socketio.on("ui_state_getkeys", namespace="/ui_state")
     def ui_state_getkeys(*args):
@@ -241,7 +241,7 @@ export function getInitialState() {
         .catch(notify),
       remoteAccess.then(parse).then((json) => { state.remoteAccess = json.data; }).catch(notify),
       workflow.then(parse).then((json) => { state.workflow = json; }).catch(notify),
-      log.then(parse).then((json) => { state.logger = json; }).catch(notify),
+      log.then(parse).then((json) => { state.logger = json.records; }).catch(notify),
     ];
 
     Promise.all(pchains).then(() => {
@@ -3,6 +3,10 @@ export function addLogRecord(data) {
   return { type: 'ADD_LOG_RECORD', data };
 }
 
+export function addLogRecords(data) {
+  return { type: 'ADD_LOG_RECORDS', data };
+}
+
 
 export function setLogPage(page) {
   return { type: 'SET_PAGE_LOGGING', page };
@@ -113,10 +113,10 @@ export function sendSyncSamples() {
 
         return result;
       }).then((json) => {
-        const { sampleList } = json;
-        const { sampleOrder } = json;
+        // Only the samples added or updated by the synchronization are sent
+        const { sampleList, added, updated } = json;
 
-        dispatch(updateSampleList(sampleList, sampleOrder));
+        dispatch(updateSampleList(sampleList, [...added, ...updated]));
         dispatch(setQueue(json));
         dispatch(setLoading(false));
       }, () => {
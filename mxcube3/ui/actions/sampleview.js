@@ -157,6 +157,29 @@ export function setVideoSize(width, height) {
   };
 }
 
+export function setVideoRendition(rendition) {
+  return function (dispatch, getState) {
+    const { sampleview } = getState();
+
+    fetch('/mxcube/api/v0.1/sampleview/camera', {
+      method: 'POST',
+      credentials: 'include',
+      headers: {
+        Accept: 'application/json',
+        'Content-type': 'application/json'
+      },
+      body: JSON.stringify({ width: sampleview.width, height: sampleview.height, rendition })
+    }).then((response) => {
+      if (response.status >= 400) {
+        throw new Error('Server refused to set video rendition');
+      }
+      return response.json();
+    }).then((json) => {
+      dispatch({ type: 'SET_VIDEO_RENDITION', rendition: json.videoRendition || 'full' });
+    });
+  };
+}
+
 export function saveMotorPositions(data) {
   return {
     type: 'SAVE_MOTOR_POSITIONS', data
@@ -117,6 +117,29 @@ export default class SampleControls extends React.Component {
       );
     });
 
+    // Renditions of the stream, selected without restarting the stream
+    if (this.props.videoRenditions.length > 1) {
+      items.push((<MenuItem divider key="renditions divider" />));
+
+      this.props.videoRenditions.forEach((rendition) => {
+        const renditionGClass = this.props.videoRendition === rendition.name ?
+          'fa-dot-circle-o' : 'fa-circle-o';
+
+        items.push((
+          <MenuItem
+            key={`rendition ${rendition.name}`}
+            eventKey="2"
+            onClick={() => this.props.sampleActions.setVideoRendition(rendition.name)}
+          >
+            <span className={`fa ${renditionGClass}`} />
+            {' '}
+            {`${rendition.name} (${rendition.framerate} fps)`}
+          </MenuItem>));
+      });
+
+      items.push((<MenuItem divider key="sizes divider" />));
+    }
+
     const autoScaleGClass = this.props.autoScale ? ' fa-check-square-o' : 'fa-square-o';
 
     items.push((
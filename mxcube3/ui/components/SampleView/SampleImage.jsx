@@ -13,6 +13,8 @@ import DrawGridPlugin from './DrawGridPlugin';
 import SampleControls from './SampleControls';
 import GridForm from './GridForm';
 
+import { find } from 'lodash';
+
 // config exported by webpack at buildtime
 // eslint-disable-next-line import/no-unresolved
 import config from 'guiConfig';
@@ -126,6 +128,18 @@ export default class SampleImage extends React.Component {
       this.initJSMpeg();
     }
 
+    // A new canvas is rendered for the selected rendition, connect a new
+    // player to it
+    if (this.props.videoRendition !== prevProps.videoRendition) {
+      if (this.player) {
+        this.player.destroy();
+        this.player = null;
+      }
+
+      this.setImageRatio();
+      this.initJSMpeg();
+    }
+
     this.renderSampleView(this.props);
   }
 
@@ -708,7 +722,7 @@ export default class SampleImage extends React.Component {
       />);
 
     if (format === 'MPEG1') {
-      result = (<canvas id="sample-img" className="img" />);
+      result = (<canvas id="sample-img" key={this.props.videoRendition} className="img" />);
     }
 
     return result;
@@ -717,14 +731,17 @@ export default class SampleImage extends React.Component {
   initJSMpeg() {
     if (this.player === null) {
       const canvas = document.getElementById('sample-img');
+      // Websocket port of the selected rendition of the stream
+      const rendition = find(this.props.videoRenditions, { name: this.props.videoRendition });
+      const port = rendition ? rendition.port : 4042;
       /* eslint-disable no-undef */
-      let source = !VIDEO_STREAM_URL ? `ws://${document.location.hostname}:4042/` : VIDEO_STREAM_URL;
+      let source = !VIDEO_STREAM_URL ? `ws://${document.location.hostname}:${port}/` : VIDEO_STREAM_URL;
       const streamOnLocalHost = VIDEO_STREAM_ON_LOCAL_HOST;
       /* eslint-enable no-undef */
 
       // Use local video stream if there is one
       if (document.location.hostname === 'localhost' && streamOnLocalHost) {
-        source = `ws://${document.location.hostname}:4042/`;
+        source = `ws://${document.location.hostname}:${port}/`;
       }
 
       source = source + this.props.videoHash;
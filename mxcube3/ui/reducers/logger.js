@@ -9,6 +9,10 @@ export default (state = initialState, action) => {
     {
       return { ...state, logRecords: [...state.logRecords, action.data] };
     }
+    case 'ADD_LOG_RECORDS':
+    {
+      return { ...state, logRecords: [...state.logRecords, ...action.data] };
+    }
     case 'SET_PAGE_LOGGING':
     {
       return { ...state, activePage: action.page };
@@ -12,6 +12,8 @@ const initialState = {
   videoHash: '',
   sourceIsScalable: false,
   videoSizes: [],
+  videoRenditions: [],
+  videoRendition: 'full',
   autoScale: true,
   imageRatio: 0,
   pixelsPerMm: [0, 0],
@@ -50,6 +52,10 @@ export default (state = initialState, action) => {
     {
       return { ...state, cinema: !state.cinema };
     }
+    case 'SET_VIDEO_RENDITION':
+    {
+      return { ...state, videoRendition: action.rendition };
+    }
     case 'SET_PIXELS_PER_MM':
     {
       return { ...state, pixelsPerMm: action.pixelsPerMm };
@@ -229,6 +235,7 @@ export default (state = initialState, action) => {
         height: action.data.Camera.imageHeight,
         videoFormat: action.data.Camera.format,
         videoSizes: action.data.Camera.videoSizes,
+        videoRenditions: action.data.Camera.videoRenditions || [],
         sourceIsScalable: action.data.Camera.sourceIsScalable,
         videoHash: action.data.Camera.videoHash,
         apertureList: action.data.beamInfo.apertureList,
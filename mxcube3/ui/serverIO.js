@@ -1,6 +1,6 @@
 import io from 'socket.io-client';
 import { addResponseMessage } from 'react-chat-widget';
-import { addLogRecord } from './actions/logger';
+import { addLogRecords } from './actions/logger';
 import {
   setShapes,
   saveMotorPosition,
@@ -62,6 +62,33 @@ import { setEnergyScanResult } from './actions/taskResults';
 
 import { CLICK_CENTRING } from './constants';
 
+// Applies the JSON patch (RFC 6902) operations add, replace and remove to
+// a copy of doc, returns the patched copy (undefined if doc was removed)
+function applyPatch(doc, patch) {
+  let result = doc === undefined ? doc : JSON.parse(JSON.stringify(doc));
+
+  patch.forEach(({ op, path, value }) => {
+    if (path === '') {
+      result = op === 'remove' ? undefined : value;
+      return;
+    }
+
+    const tokens = path.substring(1).split('/').map(
+      (t) => t.replace(/~1/g, '/').replace(/~0/g, '~')
+    );
+    const last = tokens.pop();
+    const parent = tokens.reduce((obj, t) => obj[t], result);
+
+    if (op === 'remove') {
+      delete parent[last];
+    } else {
+      parent[last] = value;
+    }
+  });
+
+  return result;
+}
+
 class ServerIO {
   constructor() {
     this.networkSocket = null;
@@ -102,10 +129,37 @@ class ServerIO {
 
   connectStateSocket(statePersistor) {
     this.uiStateSocket = io.connect(`//${document.domain}:${location.port}/ui_state`);
+    this.uiState = {};
+    this.uiStateVersion = null;
+
+    const syncState = () => {
+      this.uiStateSocket.emit('ui_state_sync', null, ({ version, state }) => {
+        this.uiState = state;
+        this.uiStateVersion = version;
+        statePersistor.rehydrate(state);
+      });
+    };
+
+    // Changes are sent as JSON patches of a single key, a missed version
+    // means the local copy is stale and the complete state is fetched again
+    this.uiStateSocket.on('state_patch', ({ version, key, patch }) => {
+      if (this.uiStateVersion === null || version !== this.uiStateVersion + 1) {
+        syncState();
+        return;
+      }
 
-    this.uiStateSocket.on('state_update', (newState) => {
-      statePersistor.rehydrate(JSON.parse(newState));
+      this.uiStateVersion = version;
+      const value = applyPatch(this.uiState[key], patch);
+
+      if (value === undefined) {
+        delete this.uiState[key];
+      } else {
+        this.uiState[key] = value;
+        statePersistor.rehydrate({ [key]: value });
+      }
     });
+
+    this.uiStateSocket.on('connect', syncState);
   }
 
   // setRemoteAccessMaster(name, cb) {
@@ -128,9 +182,11 @@ class ServerIO {
     this.hwrSocket = io.connect(`//${document.domain}:${location.port}/hwr`);
     this.loggingSocket = io.connect(`//${document.domain}:${location.port}/logging`);
 
-    this.loggingSocket.on('log_record', (record) => {
-      this.dispatch(addUserMessage(record));
-      this.dispatch(addLogRecord(record));
+    this.loggingSocket.on('log_records', (records) => {
+      records.forEach((record) => {
+        this.dispatch(addUserMessage(record));
+      });
+      this.dispatch(addLogRecords(records));
     });
 
     this.hwrSocket.on('ra_chat_message', (record) => {
@@ -1,79 +1,357 @@
 """Utileties for starting video encoding and streaming."""
 # -*- coding: utf-8 -*-
+import json
 import os
+import signal
+import socket
 import subprocess
 import sys
+import threading
 import time
 import uuid
 
+# Renditions encoded from the captured video. The size of a rendition is the
+# stream size divided by scale, quality is passed to ffmpeg -q:v (lower is
+# better). The first rendition uses the stream and websocket ports below,
+# rendition n the ports + 2 * n (n being its position in RENDITIONS, also
+# when only some of the renditions are streamed).
+RENDITIONS = (
+    {"name": "full", "scale": 1, "framerate": 30, "quality": 2},
+    {"name": "half", "scale": 2, "framerate": 15, "quality": 4},
+    {"name": "quarter", "scale": 4, "framerate": 10, "quality": 6},
+)
 
-def monitor(*processes):
+STREAM_PORT = 4041
+WEBSOCKET_PORT = 4042
+
+PID_FILE = "/tmp/mxcube.pid"
+METRICS_FILE = "/tmp/mxcube-streaming-%s.json"
+
+# Restart back off, doubled for each consecutive failure, in seconds
+MIN_BACKOFF = 1
+MAX_BACKOFF = 30
+
+# Processes running longer than this (seconds) are considered to be stable,
+# the back off is then reset
+STABLE_TIME = 60
+
+# Time in seconds the processes together get to exit after SIGTERM before
+# they are killed, the server waits a bit longer for the supervisor, see
+# Server.kill_processes
+STOP_TIMEOUT = 3
+
+
+def wait_for_port(port, timeout=10):
     """
-    Monitor processes, terminate all processes if one dies.
+    Waits until a process accepts connections on localhost:<port>
 
-    :param processes: processes to monitor
+    :returns: True if the port is open, False on timeout
+    :rtype: bool
     """
-    while True:
-        if all([p.poll() is None for p in processes]):
-            time.sleep(1)
+    t0 = time.time()
+
+    while time.time() - t0 < timeout:
+        try:
+            with socket.create_connection(("localhost", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+
+    return False
 
-    for p in processes:
-        p.terminate()
 
+def write_pid(pid):
+    with open(PID_FILE, "a") as f:
+        f.write(" %s " % pid)
 
-def start(device, scale, _hash):
+
+def read_metrics(_hash):
     """
-    Start encoding and streaming from device video_device.
+    Metrics of the streaming supervisor for stream <_hash>
 
-    :param str device: The path to the device to stream from
-    :returns: Tupple with the two processes performing streaming and encoding
+    :returns: The metrics, see StreamingSupervisor, empty if not running
+    :rtype: dict
+    """
+    try:
+        with open(METRICS_FILE % _hash, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def rendition_ports(rendition):
+    """
+    Stream (ffmpeg to relay) and websocket (relay to clients) ports of
+    <rendition>
+
+    :returns: Tuple (stream port, websocket port)
     :rtype: tuple
     """
+    offset = 2 * [r["name"] for r in RENDITIONS].index(rendition["name"])
+    return STREAM_PORT + offset, WEBSOCKET_PORT + offset
+
+
+def get_renditions(width, height, renditions=RENDITIONS):
+    """
+    Describes the renditions of a stream of size <width> x <height>
+
+    :returns: List of dictionaries with the name, width, height, framerate
+              and websocket port of each rendition
+    :rtype: list
+    """
+    result = []
+
+    for rendition in renditions:
+        result.append(
+            {
+                "name": rendition["name"],
+                "width": int(width / rendition["scale"]),
+                "height": int(height / rendition["scale"]),
+                "framerate": rendition["framerate"],
+                "port": rendition_ports(rendition)[1],
+            }
+        )
+
+    return result
+
+
+def ffmpeg_command(device, scale, _hash, renditions=RENDITIONS):
+    """
+    ffmpeg command capturing from <device> once and encoding each of the
+    <renditions> to its relay
+
+    :param str device: The path to the device to stream from
+    :param tuple scale: Stream size (width, height)
+    :param str _hash: Stream secret
+    :returns: The command
+    :rtype: list
+    """
+    scale = "scale=w=%s:h=%s:force_original_aspect_ratio=decrease" % scale
+
+    # Capture and scale once, then split the frames to one branch per
+    # rendition, MPEG1 requires even frame sizes
+    branches = "".join("[s%s]" % idx for idx in range(len(renditions)))
+    filters = ["[0:v]%s,split=%s%s" % (scale, len(renditions), branches)]
+
+    for idx, rendition in enumerate(renditions):
+        filters.append(
+            "[s%s]scale=trunc(iw/%s/2)*2:trunc(ih/%s/2)*2,fps=%s[o%s]"
+            % (idx, rendition["scale"], rendition["scale"], rendition["framerate"], idx)
+        )
+
+    cmd = [
+        "ffmpeg",
+        "-f",
+        "v4l2",
+        "-framerate",
+        "30",
+        "-i",
+        device,
+        "-filter_complex",
+        ";".join(filters),
+    ]
+
+    for idx, rendition in enumerate(renditions):
+        cmd.extend(
+            [
+                "-map",
+                "[o%s]" % idx,
+                "-f",
+                "mpegts",
+                "-b:v",
+                "0k",
+                "-q:v",
+                str(rendition["quality"]),
+                "-an",
+                "-vcodec",
+                "mpeg1video",
+                "http://localhost:%s/%s" % (rendition_ports(rendition)[0], _hash),
+            ]
+        )
+    return cmd
+
+
+def start_relays(_hash, renditions=RENDITIONS, timeout=10):
+    """
+    Starts one websocket relay for each rendition and waits for them to
+    accept connections.
+
+    :returns: List of relay processes
+    :rtype: list
+    :raises RuntimeError: If a relay is not ready within <timeout> seconds
+    """
     fpath = os.path.dirname(__file__)
     websocket_relay_js = os.path.join(fpath, "websocket-relay.js")
 
-    FNULL = open(os.devnull, "w")
+    ports = [rendition_ports(rendition) for rendition in renditions]
+    relays = []
 
-    relay = subprocess.Popen(
-        ["node", websocket_relay_js, _hash, "4041", "4042"], shell=False
-    )
+    for stream_port, websocket_port in ports:
+        relays.append(
+            subprocess.Popen(
+                [
+                    "node",
+                    websocket_relay_js,
+                    _hash,
+                    str(stream_port),
+                    str(websocket_port),
+                ],
+                shell=False,
+            )
+        )
 
-    # Make sure that the relay is running (socket is open)
-    time.sleep(2)
+    for stream_port, _ in ports:
+        if not wait_for_port(stream_port, timeout):
+            for p in relays:
+                p.kill()
 
-    scale = "scale=w=%s:h=%s:force_original_aspect_ratio=decrease" % scale
+            raise RuntimeError("Relay on port %s not ready" % stream_port)
+
+    return relays
+
+
+class StreamingSupervisor:
+    """
+    Runs the relay and encoder processes of a stream and keeps them running.
+    The relays are probed until they accept connections before the encoder
+    is started. If any of the processes dies all of them are stopped and
+    started again after a back off delay, doubled for each consecutive
+    failure. SIGTERM stops the processes and the supervisor.
+
+    The metrics (state, frames, fps, latency of the encoder relative to real
+    time, restarts, uptime) are written as JSON to METRICS_FILE every
+    <interval> seconds, see read_metrics.
+    """
+
+    def __init__(self, device, scale, _hash, renditions=RENDITIONS, interval=1):
+        self._device = device
+        self._scale = scale
+        self._hash = _hash
+        self._renditions = renditions
+        self._interval = interval
+        self._processes = []
+        self._running = False
+        self._started_at = None
+        self._metrics_path = METRICS_FILE % _hash
+
+        self.metrics = {
+            "state": "STOPPED",
+            "frames": 0,
+            "fps": 0.0,
+            "latency": 0.0,
+            "restarts": 0,
+            "uptime": 0.0,
+        }
+
+    def _start_processes(self):
+        self.metrics["state"] = "STARTING"
+        self._processes = start_relays(self._hash, self._renditions)
+
+        cmd = ffmpeg_command(self._device, self._scale, self._hash, self._renditions)
+        # Report progress (frame, fps, out_time_us ...) on stdout
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+
+        encoder = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, shell=False
+        )
+
+        self._processes.append(encoder)
+        self._started_at = time.time()
+        self.metrics["state"] = "RUNNING"
+
+        reader = threading.Thread(
+            target=self._read_progress, args=(encoder, self._started_at)
+        )
+        reader.daemon = True
+        reader.start()
+
+    def _read_progress(self, encoder, started_at):
+        for line in encoder.stdout:
+            key, _, value = line.decode(errors="ignore").strip().partition("=")
+
+            try:
+                if key == "frame":
+                    self.metrics["frames"] = int(value)
+                elif key == "fps":
+                    self.metrics["fps"] = float(value)
+                elif key == "out_time_us":
+                    encoded = int(value) / 1e6
+                    self.metrics["latency"] = time.time() - started_at - encoded
+            except ValueError:
+                pass
+
+    def _stop_processes(self):
+        for p in self._processes:
+            p.terminate()
 
-    ffmpeg = subprocess.Popen(
-        [
-            "ffmpeg",
-            "-f",
-            "v4l2",
-            "-framerate",
-            "30",
-            "-i",
-            device,
-            "-vf",
-            scale,
-            "-f",
-            "mpegts",
-            "-b:v",
-            "0k",
-            "-q:v",
-            "2",
-            "-an",
-            "-vcodec",
-            "mpeg1video",
-            "http://localhost:4041/" + _hash,
-        ],
-        stderr=subprocess.STDOUT,
-        stdin=subprocess.PIPE,
-        shell=False,
-    )
-
-    with open("/tmp/mxcube.pid", "a") as f:
-        f.write("%s %s" % (relay.pid, ffmpeg.pid))
-
-    return relay, ffmpeg
+        deadline = time.time() + STOP_TIMEOUT
+
+        for p in self._processes:
+            try:
+                p.wait(timeout=max(deadline - time.time(), 0))
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
+
+        self._processes = []
+        self.metrics["state"] = "STOPPED"
+
+    def _write_metrics(self):
+        if self._started_at and self.metrics["state"] == "RUNNING":
+            self.metrics["uptime"] = time.time() - self._started_at
+
+        try:
+            with open(self._metrics_path, "w") as f:
+                json.dump(self.metrics, f)
+        except OSError:
+            pass
+
+    def _sleep(self, seconds):
+        t0 = time.time()
+
+        while self._running and time.time() - t0 < seconds:
+            self._write_metrics()
+            time.sleep(self._interval)
+
+    def stop(self, *args):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        backoff = MIN_BACKOFF
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        write_pid(os.getpid())
+
+        while self._running:
+            try:
+                self._start_processes()
+            except Exception as ex:
+                print("Could not start streaming: %s" % ex, file=sys.stderr)
+                self._stop_processes()
+            else:
+                while self._running and all(p.poll() is None for p in self._processes):
+                    self._write_metrics()
+                    time.sleep(self._interval)
+
+                if time.time() - self._started_at > STABLE_TIME:
+                    backoff = MIN_BACKOFF
+
+                self._stop_processes()
+
+            if self._running:
+                self.metrics["state"] = "RESTARTING"
+                self.metrics["restarts"] += 1
+                self._sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+        self._stop_processes()
+
+        try:
+            os.remove(self._metrics_path)
+        except OSError:
+            pass
 
 
 if __name__ == "__main__":
@@ -94,4 +372,11 @@ if __name__ == "__main__":
     except IndexError:
         _hash = "-1,-1"
 
-    monitor(*start(video_device, scale, _hash))
+    # Optional comma separated list of rendition names, all by default
+    try:
+        names = sys.argv[4].strip().split(",")
+        renditions = tuple(r for r in RENDITIONS if r["name"] in names)
+    except IndexError:
+        renditions = RENDITIONS
+
+    StreamingSupervisor(video_device, scale, _hash, renditions).run()
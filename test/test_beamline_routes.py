@@ -43,6 +43,43 @@ def test_beamline_get_all_attribute(client):
     assert len(actual) == len(expected)
 
 
+def test_beamline_get_attributes_delta(client):
+    """
+    Checks that the attributes are returned with a version (ETag) and that
+    nothing is returned if nothing changed since that version
+    """
+    resp = client.get("/mxcube/api/v0.1/beamline/attributes")
+    data = json.loads(resp.data)
+
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] == '"%s"' % data["version"]
+    assert "energy" in data["attributes"]
+
+    resp = client.get(
+        "/mxcube/api/v0.1/beamline/attributes",
+        headers={"If-None-Match": resp.headers["ETag"]},
+    )
+
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == '"%s"' % data["version"]
+
+    from mxcube3 import mxcube
+
+    value = data["attributes"]["transmission"]["value"]
+    mxcube.mxcubecore.get_adapter("transmission").value_change(value + 1)
+
+    resp = client.get(
+        "/mxcube/api/v0.1/beamline/attributes",
+        headers={"If-None-Match": '"%s"' % data["version"]},
+    )
+    changed = json.loads(resp.data)
+
+    assert resp.status_code == 200
+    assert changed["version"] > data["version"]
+    assert list(changed["attributes"].keys()) == ["transmission"]
+    assert changed["attributes"]["transmission"]["value"] == value + 1
+
+
 def test_beamline_get_attribute(client):
     """
     Tests retrieval of all the beamline attributes (one by one), checks that
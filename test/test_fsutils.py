@@ -0,0 +1,47 @@
+import os
+import re
+
+from mxcube3.core.util.fsutils import RunNumberIndex
+
+
+def interpret_path(path):
+    match = re.match(r"(.*)_(\d+)_(\d+)\.\w+$", path)
+
+    if not match:
+        raise ValueError(path)
+
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+def test_run_number_index(tmp_path):
+    """
+    Test that the run number index holds the highest run number of each
+    prefix, of the files on disk and of the files added afterwards, and that
+    it is saved
+    """
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+
+    for fname in ["a_1_0001.cbf", "a_3_0001.cbf", "b_2_0001.cbf", "c.cbf", "a_4.txt"]:
+        (data_path / fname).touch()
+
+    index_path = str(tmp_path / "index-%s.json")
+    index = RunNumberIndex(interpret_path, index_path)
+    index.build(str(data_path), "cbf")
+    index._build_task.join()
+
+    assert index.get(os.path.join(str(data_path), "a")) == 3
+    assert index.get(os.path.join(str(data_path), "b")) == 2
+    assert index.get(os.path.join(str(data_path), "c")) == 0
+
+    index.add_path(os.path.join(str(data_path), "c_5_0001.cbf"))
+    index.add_path(os.path.join(str(data_path), "a_2_0001.cbf"))
+
+    assert index.get(os.path.join(str(data_path), "c")) == 5
+    assert index.get(os.path.join(str(data_path), "a")) == 3
+
+    # The saved index is available before the directory is scanned again
+    index = RunNumberIndex(interpret_path, index_path)
+    index.build(str(data_path), "cbf")
+
+    assert index.get(os.path.join(str(data_path), "c")) == 5
@@ -2,6 +2,9 @@ import time
 import json
 import copy
 
+from functools import reduce
+from unittest import mock
+
 from input_parameters import (
     test_sample_5,
     test_sample_6,
@@ -194,6 +197,31 @@ def test_queue_delete_item(client):
     )
 
 
+def test_queue_get_changes(client):
+    """Test if a queue operation is recorded in the queue change log."""
+    task_to_delete = ["1:05", 0]
+    resp = client.post(
+        "/mxcube/api/v0.1/queue/delete",
+        data=json.dumps([task_to_delete]),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+
+    resp = client.get("/mxcube/api/v0.1/queue/changes")
+    changes = json.loads(resp.data).get("changes")
+    assert (
+        resp.status_code == 200
+        and changes[-1]["op"] == "delete"
+        and changes[-1]["sample"] == "1:05"
+    )
+
+
+def test_queue_dump(client):
+    """Test if we can get the entire queue as JSON."""
+    resp = client.get("/mxcube/api/v0.1/queue/dump")
+    assert resp.status_code == 200 and "1:05" in json.loads(resp.data)
+
+
 def test_queue_enable_item(client):
     """Test if we can disable a task in the sample in queue."""
     resp = client.get("/mxcube/api/v0.1/queue")
@@ -362,6 +390,315 @@ def test_queue_move_task_item_fail(client):
     )
 
 
+def test_queue_batch(client):
+    """Test if we can apply several queue operations in one request"""
+    resp = client.get("/mxcube/api/v0.1/queue")
+    queue_id = json.loads(resp.data).get("1:05")["queueID"]
+    task_to_add = copy.deepcopy(test_task)
+    task_to_add["queueID"] = queue_id
+    task_to_add["tasks"][0]["sampleQueueID"] = queue_id
+    task_to_add["tasks"][0]["parameters"]["kappa"] = 90
+
+    resp = client.post(
+        "/mxcube/api/v0.1/queue",
+        data=json.dumps([task_to_add]),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+
+    batch = [
+        {"op": "swap", "sid": "1:05", "ti1": 0, "ti2": 1},
+        {"op": "delete", "items": [["1:05", 1]]},
+    ]
+
+    resp = client.post(
+        "/mxcube/api/v0.1/queue/batch",
+        data=json.dumps(batch),
+        content_type="application/json",
+    )
+    tasks = json.loads(resp.data)["samples"]["1:05"]["tasks"]
+    assert (
+        resp.status_code == 200
+        and len(tasks) == 1
+        and tasks[0]["parameters"]["kappa"] == 90
+    )
+
+    resp = client.post(
+        "/mxcube/api/v0.1/queue/batch",
+        data=json.dumps([{"op": "delete", "items": [["unknown", 0]]}]),
+        content_type="application/json",
+    )
+    assert resp.status_code == 409
+
+
+def test_queue_batch_delete_twice(client):
+    """
+    Test that task positions of a delete refer to the queue as left by a
+    preceding delete on the same sample
+    """
+    resp = client.get("/mxcube/api/v0.1/queue")
+    queue_id = json.loads(resp.data).get("1:05")["queueID"]
+
+    for kappa in (90, 180):
+        task_to_add = copy.deepcopy(test_task)
+        task_to_add["queueID"] = queue_id
+        task_to_add["tasks"][0]["sampleQueueID"] = queue_id
+        task_to_add["tasks"][0]["parameters"]["kappa"] = kappa
+
+        resp = client.post(
+            "/mxcube/api/v0.1/queue",
+            data=json.dumps([task_to_add]),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+
+    batch = [
+        {"op": "delete", "items": [["1:05", 0]]},
+        {"op": "delete", "items": [["1:05", 0]]},
+    ]
+
+    resp = client.post(
+        "/mxcube/api/v0.1/queue/batch",
+        data=json.dumps(batch),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+
+    tasks = json.loads(resp.data)["samples"]["1:05"]["tasks"]
+    assert len(tasks) == 1 and tasks[0]["parameters"]["kappa"] == 180
+
+    resp = client.get("/mxcube/api/v0.1/queue")
+    assert json.loads(resp.data).get("1:05")["tasks"] == tasks
+
+
+def test_queue_batch_fail(client):
+    """
+    Test that a batch failing partway through is rejected as a whole and
+    leaves the queue untouched
+    """
+    resp = client.get("/mxcube/api/v0.1/queue")
+    queue = json.loads(resp.data)
+
+    batches = [
+        # Task index out of range
+        [{"op": "delete", "items": [["1:05", 5]]}],
+        # Valid delete followed by a swap of the task that was just deleted
+        [
+            {"op": "delete", "items": [["1:05", 0]]},
+            {"op": "swap", "sid": "1:05", "ti1": 0, "ti2": 0},
+        ],
+        # Valid swap followed by a delete of the sample deleted before
+        [
+            {"op": "swap", "sid": "1:05", "ti1": 0, "ti2": 0},
+            {"op": "delete", "items": [["1:01", None]]},
+            {"op": "delete", "items": [["1:01", None]]},
+        ],
+        # Malformed items
+        [{"op": "delete", "items": ["1:05"]}],
+        [{"op": "move", "sid": "1:05", "ti1": "first", "ti2": 0}],
+        [{"op": "set_enabled", "qidList": [-1], "enabled": False}],
+    ]
+
+    for batch in batches:
+        resp = client.post(
+            "/mxcube/api/v0.1/queue/batch",
+            data=json.dumps(batch),
+            content_type="application/json",
+        )
+        assert resp.status_code == 409
+
+    resp = client.get("/mxcube/api/v0.1/queue")
+    assert json.loads(resp.data) == queue
+
+
+def test_queue_snapshot_restore(client):
+    """
+    Test that the queue is restored from the snapshot with all its samples,
+    including disabled ones, and tasks. Shapes are not saved with the queue,
+    tasks on a point are restored without it and tasks that can not be
+    rebuilt without their shape are skipped.
+    """
+    from mxcube3 import mxcube
+    from mxcube3.core.util.snapshot import dump_snapshot, load_snapshot
+
+    resp = client.get("/mxcube/api/v0.1/queue")
+    queue_id = json.loads(resp.data).get("1:01")["queueID"]
+
+    resp = client.post(
+        "/mxcube/api/v0.1/queue/set_enabled",
+        data=json.dumps({"qidList": [queue_id], "enabled": False}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+
+    saved = json.loads(client.get("/mxcube/api/v0.1/queue").data)
+
+    mxcube.invalidate_snapshot()
+    mxcube.save_snapshot()
+
+    path = mxcube.CONFIG.app.SNAPSHOT_PATH
+    data = load_snapshot(path)
+    tasks = data["QUEUE"]["1:05"]["tasks"]
+    tasks[0]["parameters"]["shape"] = "P1"
+    helical = copy.deepcopy(tasks[0])
+    helical["parameters"]["helical"] = True
+    tasks.append(helical)
+    dump_snapshot(path, data)
+
+    mxcube.queue.clear_queue()
+    assert mxcube.load_snapshot()
+
+    restored = json.loads(client.get("/mxcube/api/v0.1/queue").data)
+    assert restored["sample_order"] == saved["sample_order"]
+    assert restored["1:01"]["checked"] is False
+
+    tasks = restored["1:05"]["tasks"]
+    saved_task = saved["1:05"]["tasks"][0]
+    assert len(tasks) == 1
+    assert tasks[0]["parameters"]["shape"] == -1
+    assert tasks[0]["parameters"]["fileName"] == saved_task["parameters"]["fileName"]
+    assert tasks[0]["parameters"]["kappa"] == saved_task["parameters"]["kappa"]
+
+
+def test_queue_run_number_from_index(client):
+    """
+    Test that the run number of a new task is the one following the highest
+    run number of the tasks in the queue and of the files on disk (the run
+    number index), not their sum
+    """
+    from mxcube3 import mxcube
+
+    resp = client.get("/mxcube/api/v0.1/queue")
+    queue_id = json.loads(resp.data).get("1:05")["tasks"][0]["queueID"]
+    model, _ = mxcube.queue.get_entry(queue_id)
+    pt = model.acquisitions[0].path_template
+    run_number = pt.run_number
+    next_run_number = mxcube.queue.get_run_number(pt)
+
+    # Files on disk with run numbers not above those in the queue
+    mxcube.queue.run_number_index.add_path(pt.get_image_path() % 1)
+    assert mxcube.queue.get_run_number(pt) == next_run_number
+
+    # Files on disk with a higher run number
+    pt.run_number = next_run_number + 5
+    mxcube.queue.run_number_index.add_path(pt.get_image_path() % 1)
+    pt.run_number = run_number
+    assert mxcube.queue.get_run_number(pt) == next_run_number + 6
+
+
+def test_sample_list_synch_with_queue(client):
+    """
+    Test that a change of the queue shows in the sample list on the next
+    read and that the sample list is not synchronized again when nothing
+    changed
+    """
+    from mxcube3 import mxcube
+
+    mxcube.lims.sample_list_update_sample("1:05", copy.deepcopy(test_sample_5))
+    mxcube.lims.sample_list_get()
+
+    resp = client.get("/mxcube/api/v0.1/queue")
+    queue_id = json.loads(resp.data).get("1:05")["tasks"][0]["queueID"]
+
+    resp = client.post(
+        "/mxcube/api/v0.1/queue/set_enabled",
+        data=json.dumps({"qidList": [queue_id], "enabled": False}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+
+    sample = mxcube.lims.sample_list_get()["sampleList"]["1:05"]
+    assert sample["tasks"][0]["checked"] is False
+
+    with mock.patch.object(
+        mxcube.queue, "queue_to_dict", wraps=mxcube.queue.queue_to_dict
+    ) as queue_to_dict:
+        mxcube.lims.sample_list_get()
+        assert not queue_to_dict.called
+
+
+def test_queue_snapshot_invalidation(client):
+    """
+    Test that adding, updating and deleting a task only rebuilds the
+    snapshot of the sample the task belongs to, and that the queue built
+    from the snapshot is the same as the one built from the queue model
+    """
+    from mxcube3 import mxcube
+    from mxcubecore import HardwareRepository as HWR
+
+    snapshot = mxcube.queue._sample_dict_snapshot
+
+    def uncached_queue():
+        root = HWR.beamline.queue_model.get_model_root()
+
+        return reduce(
+            lambda x, y: x.update(y) or x,
+            mxcube.queue.queue_to_dict_rec(root),
+            {},
+        )
+
+    queue = mxcube.queue.queue_to_dict()
+    assert queue == uncached_queue()
+
+    sample_id = queue["1:05"]["queueID"]
+    other_id = queue["1:01"]["queueID"]
+    other = snapshot[other_id]
+
+    def assert_only_sample_rebuilt(change):
+        before = snapshot[sample_id]
+        change()
+
+        queue = mxcube.queue.queue_to_dict()
+
+        assert snapshot[sample_id] is not before
+        assert snapshot[other_id] is other
+        assert queue == uncached_queue()
+
+        return queue
+
+    def add_task():
+        task_to_add = copy.deepcopy(test_task)
+        task_to_add["queueID"] = sample_id
+        task_to_add["tasks"][0]["sampleQueueID"] = sample_id
+
+        resp = client.post(
+            "/mxcube/api/v0.1/queue",
+            data=json.dumps([task_to_add]),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+
+    queue = assert_only_sample_rebuilt(add_task)
+    assert len(queue["1:05"]["tasks"]) == 2
+
+    task_id = queue["1:05"]["tasks"][1]["queueID"]
+
+    def update_task():
+        task_to_update = copy.deepcopy(test_edit_task)
+        task_to_update["parameters"]["num_images"] = 10
+
+        resp = client.post(
+            "/mxcube/api/v0.1/queue/{}/{}".format(sample_id, task_id),
+            data=json.dumps(task_to_update),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+
+    queue = assert_only_sample_rebuilt(update_task)
+    assert queue["1:05"]["tasks"][1]["parameters"]["num_images"] == 10
+
+    def delete_task():
+        resp = client.post(
+            "/mxcube/api/v0.1/queue/delete",
+            data=json.dumps([["1:05", 0]]),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+
+    queue = assert_only_sample_rebuilt(delete_task)
+    assert [t["queueID"] for t in queue["1:05"]["tasks"]] == [task_id]
+
+
 def test_queue_set_sample_order(client):
     """Test if we can set the sample order in the queue."""
     sample_to_add = test_sample_6
@@ -0,0 +1,36 @@
+import json
+
+from fixture import client
+
+
+def test_chat_since_limit(client):
+    """
+    Test that paging forward from a message (since) with a limit returns the
+    messages directly after it, and that the remaining ones are signalled
+    """
+    for i in range(5):
+        resp = client.post(
+            "/mxcube/api/v0.1/ra/chat",
+            data=json.dumps({"message": "message %s" % i, "username": "test"}),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+
+    resp = client.get("/mxcube/api/v0.1/ra/chat?limit=5")
+    messages = json.loads(resp.data)["messages"]
+
+    assert [m["message"] for m in messages] == ["message %s" % i for i in range(5)]
+
+    ids = [m["id"] for m in messages]
+
+    resp = client.get("/mxcube/api/v0.1/ra/chat?since=%s&limit=2" % ids[0])
+    data = json.loads(resp.data)
+
+    assert [m["id"] for m in data["messages"]] == ids[1:3]
+    assert data["more"]
+
+    resp = client.get("/mxcube/api/v0.1/ra/chat?since=%s&limit=2" % ids[2])
+    data = json.loads(resp.data)
+
+    assert [m["id"] for m in data["messages"]] == ids[3:5]
+    assert not data["more"]
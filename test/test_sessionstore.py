@@ -0,0 +1,45 @@
+import os
+import json
+
+from mxcube3.core.util.sessionstore import SessionStore
+
+
+def test_session_store_journal(tmp_path):
+    """Test that saved keys are journaled and read back"""
+    path = str(tmp_path / "session.json")
+    store = SessionStore(path, dict)
+    store.load()
+
+    store.save({"a": 1, "b": [1, 2]})
+    store.save({"a": 2, "b": [1, 2]})
+    store.save({"a": 2})
+
+    assert SessionStore(path, dict).load() == {"a": 2}
+
+
+def test_session_store_truncated_journal(tmp_path):
+    """
+    Test that a journal truncated by a crash is read up to the last complete
+    record and that records saved afterwards are not lost
+    """
+    path = str(tmp_path / "session.json")
+    store = SessionStore(path, dict)
+    store.load()
+
+    store.save({"a": 1})
+    store.save({"a": 1, "b": 2})
+
+    with open(store.journal_path, "rb+") as f:
+        f.truncate(os.path.getsize(store.journal_path) - 5)
+
+    store = SessionStore(path, dict)
+    assert store.load() == {"a": 1}
+
+    store.save({"a": 1, "c": 3})
+    store.save({"a": 1, "c": 3, "d": 4})
+
+    assert SessionStore(path, dict).load() == {"a": 1, "c": 3, "d": 4}
+
+    with open(store.journal_path, "r") as f:
+        for line in f:
+            json.loads(line)